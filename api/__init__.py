@@ -5,16 +5,34 @@ from flask_jwt_extended import JWTManager
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
+from .uploads import StreamingUploadRequest
+from .database import configure_database
+from app_logging import configure_logging
 
 load_dotenv()
 
+# Largest accepted upload, overridable through MAX_UPLOAD_MB
+DEFAULT_MAX_UPLOAD_MB = 200
+
 db = SQLAlchemy()
 jwt = JWTManager()
 
-def create_app():
+def create_app(start_jobs: bool = True):
+    """Create the app, bring the schema up to date and start the upload job dispatcher.
+
+    The dispatcher runs JOB_WORKERS jobs at a time in this process (none when it
+    is 0); tooling passes start_jobs=False. Every process serving the app runs
+    its own dispatcher and they share the queue through the database. Threads
+    don't survive fork, so don't create the app before forking workers (e.g.
+    gunicorn --preload).
+    """
+    configure_logging()  # Before Flask sets up app.logger, so it uses the queued handler
     app = Flask(__name__)
+    # Stream uploads to disk while hashing them instead of buffering whole requests
+    app.request_class = StreamingUploadRequest
     CORS(app, 
          supports_credentials=True,
+         expose_headers=['X-Total-Count'],
          resources={r"/api/*": {"origins": ["http://localhost:5173", "http://127.0.0.1:5173"]}})
     
     # Configuration
@@ -23,11 +41,12 @@ def create_app():
     app.config['SESSION_COOKIE_SECURE'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
     app.config['TEMP_FOLDER'] = os.path.join(os.getcwd(), 'temp')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///questions.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', DEFAULT_MAX_UPLOAD_MB)) * 1024 * 1024
+    configure_database(app)  # DATABASE_URL, pool and SQLite pragmas
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
+    # Comma-separated user IDs allowed to see operational endpoints such as job metrics
+    app.config['ADMIN_USER_IDS'] = {int(i) for i in os.getenv('ADMIN_USER_IDS', '').split(',') if i.strip()}
 
     # Initialize extensions
     db.init_app(app)
@@ -48,4 +67,16 @@ def create_app():
     app.register_blueprint(quiz_bp)
     app.register_blueprint(files_bp)
 
+    # The dispatcher claims jobs straight away, so the tables must exist first
+    from .migrations import upgrade_schema
+    with app.app_context():
+        db.create_all()
+        upgrade_schema(db.engine)
+
+    # Register the job queue for PDF uploads and start its dispatcher
+    from .jobs import init_job_queue, start_job_queue
+    init_job_queue(app)
+    if start_jobs:
+        start_job_queue(app)
+
     return app
@@ -0,0 +1,166 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Defaults can be overridden through the environment
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_SET_CACHE_ENTRIES = 128  # Question sets whose payloads are kept in memory
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU cache."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate):
+        """Remove every entry whose key satisfies predicate."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SharedPayloadStore:
+    """SQLite file shared by every worker on the host, behind the in-process cache.
+
+    Holds one JSON payload per question set; storing a newer version of a set
+    replaces the older ones.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS set_payloads (
+                set_id INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (set_id, version)
+            )""")
+
+    def get(self, set_id: int, version: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM set_payloads WHERE set_id = ? AND version = ?', (set_id, version)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, set_id: int, version: str, value: str):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM set_payloads WHERE set_id = ?', (set_id,))
+            self._conn.execute(
+                'INSERT INTO set_payloads (set_id, version, value) VALUES (?, ?, ?)', (set_id, version, value)
+            )
+            self._conn.execute('COMMIT')
+
+    def delete(self, set_id: int):
+        with self._lock:
+            self._conn.execute('DELETE FROM set_payloads WHERE set_id = ?', (set_id,))
+
+
+class SetPayloadCache:
+    """Read-through cache of completed question sets' payloads keyed by (set ID, version).
+
+    Payloads are the set's questions already decoded into plain dicts. A set's
+    version changes whenever it is modified, so stale entries are simply never
+    looked up again; invalidate() also drops them eagerly. With a shared store,
+    a payload built by one worker is reused by the others on the same host.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_SET_CACHE_ENTRIES, store: SharedPayloadStore = None):
+        self.memory = LRUCache(max_entries)
+        self.store = store
+
+    def get(self, set_id: int, version: str) -> Optional[list]:
+        payload = self.memory.get((set_id, version))
+        if payload is None and self.store is not None:
+            value = self.store.get(set_id, version)
+            if value is not None:
+                payload = json.loads(value)
+                self.memory.set((set_id, version), payload)
+        return payload
+
+    def set(self, set_id: int, version: str, payload: list):
+        self.memory.set((set_id, version), payload)
+        if self.store is not None:
+            self.store.set(set_id, version, json.dumps(payload))
+
+    def get_or_load(self, set_id: int, version: str, load) -> list:
+        """Return the cached payload, calling load() to build and cache it on a miss."""
+        payload = self.get(set_id, version)
+        if payload is None:
+            payload = load()
+            self.set(set_id, version, payload)
+        return payload
+
+    def invalidate(self, set_id: int):
+        """Drop every cached version of a set."""
+        self.memory.pop_where(lambda key: key[0] == set_id)
+        answer_keys.pop_where(lambda key: key[0] == set_id)
+        encoded_responses.pop_where(lambda key: key[0] == set_id)
+        if self.store is not None:
+            self.store.delete(set_id)
+
+
+# Answer keys derived from cached payloads: (set ID, version) -> {question ID: (question text, correct answer)}
+answer_keys = LRUCache()
+
+# Serialized (and compressed) response bodies: (set ID, version, content coding or None) -> bytes
+encoded_responses = LRUCache()
+
+_set_cache = None
+_set_cache_lock = threading.Lock()
+
+
+def get_set_cache() -> SetPayloadCache:
+    """Return the process-wide question set cache, shared on disk if SET_CACHE_PATH is set."""
+    global _set_cache
+    with _set_cache_lock:
+        if _set_cache is None:
+            path = os.getenv('SET_CACHE_PATH')
+            _set_cache = SetPayloadCache(
+                max_entries=int(os.getenv('SET_CACHE_MAX_ENTRIES', DEFAULT_SET_CACHE_ENTRIES)),
+                store=SharedPayloadStore(path) if path else None
+            )
+        return _set_cache
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+# Defaults can be overridden through the environment
+DEFAULT_DATABASE_URL = 'sqlite:///questions.db'
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 20
+DEFAULT_POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+DEFAULT_POOL_RECYCLE = 1800  # Seconds before a server connection is replaced
+DEFAULT_SQLITE_BUSY_TIMEOUT = 5000  # Milliseconds a writer waits for the lock before failing
+DEFAULT_SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # 256 MB
+DEFAULT_SQLITE_SYNCHRONOUS = 'NORMAL'  # Safe with WAL; only the last commits can be lost on power failure
+
+
+def get_database_url() -> str:
+    """Return the database URL from DATABASE_URL, defaulting to the local SQLite file."""
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        # Heroku-style URLs; SQLAlchemy only accepts the postgresql scheme
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def get_engine_options(database_url: str) -> dict:
+    """Return SQLALCHEMY_ENGINE_OPTIONS tuned for the database behind database_url."""
+    url = make_url(database_url)
+    pool = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)),
+    }
+    if url.get_backend_name() != 'sqlite':
+        return {
+            **pool,
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE)),
+            'pool_pre_ping': True,  # Drop connections the server closed while idle
+        }
+    if is_memory_sqlite(url):
+        return {}  # Flask-SQLAlchemy shares one connection for in-memory databases
+    # SQLite file databases default to NullPool, which reopens the file (and
+    # re-runs the pragmas) for every checkout. Pooled connections keep their
+    # page cache and memory map; they are used from job threads, so allow that.
+    return {
+        **pool,
+        'poolclass': QueuePool,
+        'connect_args': {'check_same_thread': False},
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for concurrent readers and a background writer.
+
+    WAL lets quiz reads proceed while an upload job is committing, busy_timeout
+    makes a second writer wait for the lock instead of failing with "database
+    is locked", and mmap serves reads straight from the page cache.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', DEFAULT_SQLITE_SYNCHRONOUS)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', DEFAULT_SQLITE_BUSY_TIMEOUT))}")
+        cursor.execute(f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', DEFAULT_SQLITE_MMAP_SIZE))}")
+    finally:
+        cursor.close()
+
+
+def configure_database(app):
+    """Set the app's database URL and engine options; call before db.init_app(app)."""
+    database_url = get_database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(database_url)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -0,0 +1,135 @@
+from datetime import datetime
+import ijson
+from ijson.common import ObjectBuilder
+from sqlalchemy import insert
+from .models import QuestionSet, Question, db
+from .utils import process_options
+from .cache import get_set_cache
+
+IMPORT_BATCH_SIZE = 100  # Rows per INSERT; keeps each statement under SQLite's bound-parameter limit
+
+
+class QuestionImportError(ValueError):
+    """Raised when an imported document is invalid; index is the 0-based offending question, if any."""
+
+    def __init__(self, message: str, index: int = None):
+        super().__init__(message if index is None else f"Question {index + 1}: {message}")
+        self.index = index
+
+
+def iter_document(stream):
+    """Parse a {"questions": [...], ...} document incrementally.
+
+    Yields ('field', key, value) for top-level scalar fields and
+    ('question', index, value) for each element of the questions array, so only
+    one question is held in memory at a time.
+    """
+    builder = None
+    index = 0
+    saw_questions = False
+    events = ijson.parse(stream, use_float=True)
+
+    prefix, event, value = next(events, ('', None, None))
+    if event != 'start_map':
+        raise QuestionImportError('Invalid JSON format. Must contain a "questions" array')
+
+    for prefix, event, value in events:
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'questions.item' and event in ('end_map', 'end_array'):
+                yield 'question', index, builder.value
+                builder = None
+                index += 1
+        elif prefix == 'questions':
+            if event == 'start_array':
+                saw_questions = True
+            elif event != 'end_array':
+                raise QuestionImportError('Questions must be an array')
+        elif prefix == 'questions.item':
+            if event in ('start_map', 'start_array'):
+                builder = ObjectBuilder()
+                builder.event(event, value)
+            else:
+                yield 'question', index, value
+                index += 1
+        elif '.' not in prefix and event in ('string', 'number', 'boolean', 'null'):
+            yield 'field', prefix, value
+
+    if not saw_questions:
+        raise QuestionImportError('Invalid JSON format. Must contain a "questions" array')
+
+
+def validate_question(q, index: int, strict: bool) -> dict:
+    """Check one imported question and return its row values without the set ID."""
+    if not isinstance(q, dict) or not all(k in q for k in ('question', 'options', 'correct_answer')):
+        raise QuestionImportError('Each question must have question, options, and correct_answer', index)
+    if strict:
+        if not isinstance(q['options'], list):
+            raise QuestionImportError('Options must be an array', index)
+        if q['correct_answer'] not in q['options']:
+            raise QuestionImportError('Correct answer must be one of the options', index)
+    try:
+        options = process_options(q['options'])
+    except ValueError as e:
+        raise QuestionImportError(str(e), index)
+    return {
+        'question_text': q['question'],
+        'options': options,
+        'correct_answer': q['correct_answer'],
+        'source_lecture': q.get('source_lecture', ''),
+        'page_range': q.get('page_range', '')
+    }
+
+
+def import_questions(stream, user_id: int, set_name: str = None, strict: bool = True,
+                     batch_size: int = IMPORT_BATCH_SIZE):
+    """Stream a question bank into a new question set.
+
+    Questions are validated as they are parsed and inserted in multi-row batches,
+    all in one transaction, so an invalid question leaves nothing behind. When
+    set_name is None the document's top-level "name" field is used. strict
+    requires options to be a list containing the correct answer. Returns the
+    set and the number of questions imported. Must be called inside an app context.
+    """
+    question_set = QuestionSet(name=set_name or '', user_id=user_id, status='partial')
+    db.session.add(question_set)
+    db.session.flush()
+
+    batch = []
+    count = 0
+    name = set_name
+    now = datetime.utcnow()
+    try:
+        for kind, key, value in iter_document(stream):
+            if kind == 'field':
+                if key == 'name' and set_name is None:
+                    name = value
+                continue
+            row = validate_question(value, key, strict)
+            row['set_id'] = question_set.id
+            row['created_at'] = now
+            batch.append(row)
+            if len(batch) >= batch_size:
+                db.session.execute(insert(Question).values(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Question).values(batch))
+            count += len(batch)
+    except ijson.JSONError as e:
+        db.session.rollback()
+        raise QuestionImportError(f'Invalid JSON file: {str(e)}')
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not name:
+        db.session.rollback()
+        raise QuestionImportError('Missing required fields')
+
+    question_set.name = name
+    question_set.status = 'complete'
+    db.session.commit()
+    # The ID may have belonged to a deleted set whose payload another request cached
+    get_set_cache().invalidate(question_set.id)
+    return question_set, count
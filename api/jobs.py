@@ -0,0 +1,416 @@
+import os
+import json
+import uuid
+import socket
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, literal
+from mcq_extractor import MCQExtractor
+from mcq_generator import MCQGenerator
+from llm_engine import get_llm_engine
+from pdf_text import PDFDocument
+from .models import Job, JobChunk, Lecture, QuestionSet, Question, db
+from .utils import process_options, cleanup_file
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Defaults can be overridden through the environment
+DEFAULT_JOB_WORKERS = 4  # Jobs processed concurrently by this process
+POLL_INTERVAL = 1.0  # Seconds between dispatcher passes
+STALE_AFTER = 60  # Seconds without a heartbeat before a processing job is considered orphaned
+JOB_RETENTION = 24 * 3600  # Seconds finished jobs are kept for progress lookups
+MAINTENANCE_EVERY = 30  # Dispatcher passes between stale-job recovery and cleanup runs
+
+TERMINAL_STATUSES = ('complete', 'error', 'cancelled')
+
+
+class JobQueue:
+    """Durable upload job queue backed by the application database.
+
+    Jobs survive restarts and are shared by every process using the same
+    database. Each process runs one dispatcher thread that claims queued jobs
+    by priority, runs up to ``max_workers`` of them on the shared LLM engine,
+    writes progress and heartbeats, and re-queues jobs whose owner died so they
+    resume from their last finished chunk.
+    """
+
+    def __init__(self, app, max_workers: int = DEFAULT_JOB_WORKERS):
+        self.app = app
+        self.max_workers = max_workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running = {}  # Job ID -> concurrent future of the job coroutine
+        self._progress = {}  # Job ID -> latest (message, percent), flushed by the dispatcher
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, user_id: int, file_path: str, set_name: str, model_type: str,
+                num_questions: int, priority: int = None, job_id: str = None, lecture_id: int = None) -> str:
+        """Persist a new job and wake the dispatcher. Must be called inside an app context.
+
+        Without an explicit priority, users with fewer unfinished jobs go first,
+        so one user's batch of uploads can't starve everyone else.
+        """
+        if priority is None:
+            priority = -Job.query.filter(
+                Job.user_id == user_id, Job.status.in_(('queued', 'processing'))
+            ).count()
+        job = Job(
+            id=job_id or str(uuid.uuid4()),
+            user_id=user_id,
+            status='queued',
+            priority=priority,
+            model_type=model_type,
+            set_name=set_name,
+            num_questions=num_questions,
+            file_path=file_path,
+            lecture_id=lecture_id,
+            message='Waiting to be processed...',
+            percent=0
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._wakeup.set()
+        return job.id
+
+    def cancel(self, job_id: str, user_id: int) -> bool:
+        """Cancel a queued job or ask the owning process to stop a running one."""
+        cancelled = Job.query.filter_by(id=job_id, user_id=user_id, status='queued').update({
+            'status': 'cancelled',
+            'message': 'Cancelled',
+            'percent': 100
+        }, synchronize_session=False)
+        if not cancelled:
+            cancelled = Job.query.filter_by(id=job_id, user_id=user_id, status='processing').update({
+                'cancel_requested': True
+            }, synchronize_session=False)
+        db.session.commit()
+        self._wakeup.set()
+        return bool(cancelled)
+
+    def metrics(self) -> dict:
+        """Queue depth and job counts. Must be called inside an app context."""
+        counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+        oldest_queued = db.session.query(func.min(Job.created_at)).filter(Job.status == 'queued').scalar()
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'processing': counts.get('processing', 0),
+            'counts': counts,
+            'oldest_queued_seconds': (datetime.utcnow() - oldest_queued).total_seconds() if oldest_queued else 0,
+            'worker_id': self.worker_id,
+            'running_here': len(self._running),
+            'max_workers': self.max_workers
+        }
+
+    def set_progress(self, job_id: str, message: str, percent: float):
+        with self._lock:
+            self._progress[job_id] = (message, percent)
+
+    def _dispatch_loop(self):
+        passes = 0
+        while True:
+            try:
+                with self.app.app_context():
+                    self._flush()
+                    self._handle_cancellations()
+                    if passes % MAINTENANCE_EVERY == 0:
+                        self._recover_stale_jobs()
+                        self._delete_old_jobs()
+                    self._claim_jobs()
+            except Exception as e:
+                logger.exception("Error in job dispatcher: %s", e)
+            passes += 1
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def _flush(self):
+        """Write buffered progress and heartbeats in one transaction."""
+        with self._lock:
+            progress, self._progress = self._progress, {}
+            running = list(self._running)
+
+        now = datetime.utcnow()
+        for job_id in running:
+            values = {'heartbeat_at': now}
+            if job_id in progress:
+                values['message'], values['percent'] = progress[job_id]
+            Job.query.filter_by(id=job_id, worker_id=self.worker_id, status='processing').update(
+                values, synchronize_session=False
+            )
+        db.session.commit()
+
+    def _handle_cancellations(self):
+        running = list(self._running)
+        if not running:
+            return
+        requested = Job.query.with_entities(Job.id).filter(Job.id.in_(running), Job.cancel_requested.is_(True)).all()
+        for (job_id,) in requested:
+            future = self._running.get(job_id)
+            if future is not None:
+                future.cancel()
+
+    def _recover_stale_jobs(self):
+        """Re-queue jobs whose owning process stopped sending heartbeats."""
+        cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER)
+        recovered = Job.query.filter(Job.status == 'processing', Job.heartbeat_at < cutoff).update({
+            'status': 'queued',
+            'worker_id': None,
+            'message': 'Resuming after interruption...'
+        }, synchronize_session=False)
+        db.session.commit()
+        if recovered:
+            logger.info("Re-queued %d interrupted job(s)", recovered)
+
+    def _delete_old_jobs(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_RETENTION)
+        old_ids = [job_id for (job_id,) in Job.query.with_entities(Job.id).filter(
+            Job.status.in_(TERMINAL_STATUSES), Job.updated_at < cutoff
+        ).all()]
+        if old_ids:
+            JobChunk.query.filter(JobChunk.job_id.in_(old_ids)).delete(synchronize_session=False)
+            Job.query.filter(Job.id.in_(old_ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+    def _claim_jobs(self):
+        free_slots = self.max_workers - len(self._running)
+        if free_slots <= 0:
+            return
+        candidates = Job.query.with_entities(Job.id).filter_by(status='queued').order_by(
+            Job.priority.desc(), Job.created_at
+        ).limit(free_slots).all()
+
+        for (job_id,) in candidates:
+            # Another process may claim the same job; only the conditional update that wins proceeds
+            claimed = Job.query.filter_by(id=job_id, status='queued').update({
+                'status': 'processing',
+                'worker_id': self.worker_id,
+                'heartbeat_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                continue
+
+            future = get_llm_engine().submit(process_file_async(self.app, self, job_id))
+            with self._lock:
+                self._running[job_id] = future
+            future.add_done_callback(lambda _, job_id=job_id: self._job_finished(job_id))
+
+    def _job_finished(self, job_id: str):
+        with self._lock:
+            self._running.pop(job_id, None)
+            self._progress.pop(job_id, None)
+        self._wakeup.set()
+
+
+def _finish_job(app, job_id: str, set_status: str = None, **values):
+    """Move a job (and optionally its question set) to a terminal state.
+
+    Chunk checkpoints are kept until the job expires so progress streams can replay them.
+    """
+    with app.app_context():
+        set_id = Job.query.with_entities(Job.set_id).filter_by(id=job_id).scalar() if set_status else None
+        if set_id is not None:
+            QuestionSet.query.filter_by(id=set_id).update(
+                {'status': set_status, 'version': QuestionSet.version + 1}, synchronize_session=False
+            )
+        Job.query.filter_by(id=job_id).update(dict(values, percent=100), synchronize_session=False)
+        db.session.commit()
+
+
+def _save_chunk(app, job_id: str, chunk_index: int, chunk_questions: list, max_questions: int = None) -> int:
+    """Persist one finished batch and its checkpoint in a single transaction.
+
+    The job's question set is created with status 'partial' when the first batch
+    arrives, and questions are written with one multi-row INSERT, tagged with
+    chunk_index so the set reads in document order whichever batch finished
+    first. Returns the number of questions saved for the job so far.
+    """
+    with app.app_context():
+        job = Job.query.get(job_id)
+        if job.set_id is None:
+            question_set = QuestionSet(
+                name=job.set_name, user_id=job.user_id, status='partial', lecture_id=job.lecture_id,
+                model_type=job.model_type, num_questions=job.num_questions
+            )
+            db.session.add(question_set)
+            db.session.flush()
+            job.set_id = question_set.id
+
+        saved = Question.query.filter_by(set_id=job.set_id).count()
+        if max_questions is not None:
+            chunk_questions = chunk_questions[:max(0, max_questions - saved)]
+
+        now = datetime.utcnow()
+        rows = [{
+            'question_text': q['question'],
+            'options': process_options(q['options']),
+            'correct_answer': q['correct_answer'],
+            'set_id': job.set_id,
+            'source_lecture': q.get('source_lecture', ''),
+            'page_range': q.get('page_range', ''),
+            'chunk_index': chunk_index,
+            'created_at': now
+        } for q in chunk_questions]
+        if rows:
+            db.session.execute(insert(Question).values(rows))
+        db.session.add(JobChunk(job_id=job_id, chunk_index=chunk_index, questions=json.dumps(chunk_questions)))
+        db.session.commit()
+        return saved + len(rows)
+
+
+def find_processed_set(content_hash: str, model_type: str, num_questions: int):
+    """Return a completed question set built from identical PDF bytes with the same settings, if any.
+
+    Must be called inside an app context.
+    """
+    query = QuestionSet.query.join(Lecture, QuestionSet.lecture_id == Lecture.id).filter(
+        Lecture.content_hash == content_hash,
+        QuestionSet.status == 'complete',
+        QuestionSet.model_type == model_type
+    )
+    if model_type == 'generator':
+        query = query.filter(QuestionSet.num_questions == num_questions)
+    return query.order_by(QuestionSet.id.desc()).first()
+
+
+def reuse_processed_set(source: QuestionSet, job_id: str, user_id: int, set_name: str, lecture_id: int,
+                        file_path: str) -> int:
+    """Give the user a copy of an already processed set instead of running the pipeline again.
+
+    The questions are cloned with a single INSERT ... SELECT, and a finished job is
+    recorded under job_id so progress lookups behave as for a processed upload.
+    Returns the new set's ID. Must be called inside an app context.
+    """
+    question_set = QuestionSet(
+        name=set_name, user_id=user_id, status='complete', lecture_id=lecture_id,
+        model_type=source.model_type, num_questions=source.num_questions
+    )
+    db.session.add(question_set)
+    db.session.flush()
+
+    columns = ['question_text', 'options', 'correct_answer', 'set_id', 'source_lecture', 'page_range',
+               'chunk_index', 'created_at']
+    db.session.execute(insert(Question).from_select(columns, select(
+        Question.question_text, Question.options, Question.correct_answer, literal(question_set.id),
+        Question.source_lecture, Question.page_range, Question.chunk_index, literal(datetime.utcnow())
+    ).where(Question.set_id == source.id).order_by(Question.chunk_index, Question.id)))
+    copied = Question.query.filter_by(set_id=question_set.id).count()
+
+    db.session.add(Job(
+        id=job_id,
+        user_id=user_id,
+        status='complete',
+        model_type=source.model_type,
+        set_name=set_name,
+        num_questions=source.num_questions or copied,
+        file_path=file_path,
+        lecture_id=lecture_id,
+        set_id=question_set.id,
+        message=f'Successfully processed {copied} questions (reused from an identical upload)',
+        percent=100
+    ))
+    db.session.commit()
+    return question_set.id
+
+
+async def process_file_async(app, queue: JobQueue, job_id: str):
+    """Process an upload job on the shared LLM engine and clean up afterwards.
+
+    Blocking steps (PDF parsing, database writes) run on the engine's
+    fixed thread pool so the event loop stays free for other jobs.
+    """
+    engine = get_llm_engine()
+
+    def load_job():
+        with app.app_context():
+            job = Job.query.get(job_id)
+            chunks = JobChunk.query.filter_by(job_id=job_id).all()
+            completed_chunks = {c.chunk_index: json.loads(c.questions) for c in chunks}
+            saved_count = Question.query.filter_by(set_id=job.set_id).count() if job.set_id else 0
+            return (job.file_path, job.set_name, job.num_questions, job.model_type,
+                    completed_chunks, saved_count)
+
+    file_path, set_name, num_questions, model_type, completed_chunks, saved_count = await engine.run_blocking(load_job)
+    saved = {'count': saved_count}
+    try:
+        logger.info("Processing PDF file: %s", file_path)
+        queue.set_progress(job_id, 'Starting processing...', 0)
+        if completed_chunks:
+            logger.info("Resuming job %s with %d finished chunk(s)", job_id, len(completed_chunks))
+
+        # Parsed once here and shared with the processor; each job gets its own processor
+        # so progress callbacks don't collide
+        document = PDFDocument(file_path)
+        processor = MCQGenerator() if model_type == 'generator' else MCQExtractor()
+
+        # Extract questions using AI
+        def progress_callback(message, current, total):
+            percent = 20 + (current / total * 60)  # Scale to 20-80%
+            queue.set_progress(job_id, message, percent)
+
+        processor.set_progress_callback(progress_callback)
+
+        # Each finished batch is written to the database as soon as it arrives
+        max_questions = num_questions if model_type == 'generator' else None
+
+        async def save_chunk(index, chunk_questions):
+            saved['count'] = await engine.run_blocking(
+                _save_chunk, app, job_id, index, chunk_questions, max_questions
+            )
+
+        processor.set_checkpoint(completed_chunks, save_chunk)
+
+        if model_type == 'generator':
+            # The generator streams pages from the document as they are parsed
+            questions = {'questions': await processor.process_document_async(document, questions_per_chunk=num_questions)}
+        else:
+            pdf_text = await engine.run_blocking(processor.extract_text_from_document, document)
+            queue.set_progress(job_id, 'Extracted text from PDF, processing questions...', 20)
+            questions = await processor.extract_mcqs_async(pdf_text)
+
+        if not questions or not questions.get('questions'):
+            raise Exception("No questions were extracted from the file")
+
+        logger.info("Saved %d questions to database with set name: %s", saved['count'], set_name)
+        await engine.run_blocking(lambda: _finish_job(
+            app, job_id,
+            set_status='complete',
+            status='complete',
+            message=f'Successfully processed {saved["count"]} questions'
+        ))
+        cleanup_file(file_path)
+
+    except asyncio.CancelledError:
+        logger.info("Job %s cancelled", job_id)
+        await engine.run_blocking(lambda: _finish_job(
+            app, job_id, set_status='cancelled', status='cancelled', message='Cancelled'
+        ))
+        cleanup_file(file_path)
+    except Exception as e:
+        logger.error("Error processing file: %s", e)
+        await engine.run_blocking(lambda: _finish_job(
+            app, job_id, set_status='failed', status='error', message=str(e), error=str(e)
+        ))
+        cleanup_file(file_path)
+
+
+def init_job_queue(app) -> JobQueue:
+    """Register the app's job queue without starting it, so routes can enqueue and cancel."""
+    job_queue = JobQueue(app, max_workers=int(os.getenv('JOB_WORKERS', DEFAULT_JOB_WORKERS)))
+    app.extensions['job_queue'] = job_queue
+    return job_queue
+
+
+def start_job_queue(app) -> JobQueue:
+    """Start the app's dispatcher unless JOB_WORKERS is 0; call once the schema exists."""
+    job_queue = app.extensions['job_queue']
+    if job_queue.max_workers > 0:
+        job_queue.start()
+    return job_queue
@@ -0,0 +1,126 @@
+import json
+from sqlalchemy import inspect, text
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Columns added after the initial schema: (table, column, DDL used to add it)
+ADDED_COLUMNS = [
+    ('question_set', 'status', "VARCHAR(20) NOT NULL DEFAULT 'complete'"),
+    ('lecture', 'content_hash', 'VARCHAR(64)'),
+    ('question_set', 'lecture_id', 'INTEGER REFERENCES lecture (id)'),
+    ('question_set', 'model_type', 'VARCHAR(20)'),
+    ('question_set', 'num_questions', 'INTEGER'),
+    ('job', 'lecture_id', 'INTEGER REFERENCES lecture (id)'),
+    ('question_set', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('question', 'chunk_index', 'INTEGER'),
+]
+
+# Indexes added after the initial schema: (name, table, columns)
+ADDED_INDEXES = [
+    ('ix_lecture_content_hash', 'lecture', ['content_hash']),
+    ('ix_question_set_lecture_id', 'question_set', ['lecture_id']),
+    ('ix_question_set_user_id_created_at', 'question_set', ['user_id', 'created_at']),
+    ('ix_question_set_id_id', 'question', ['set_id', 'id']),
+    ('ix_question_set_id_chunk_index', 'question', ['set_id', 'chunk_index', 'id']),
+]
+
+# Column types changed after the initial schema: (table, column, new type). SQLite doesn't
+# enforce declared types, so these are only applied on server databases.
+CHANGED_COLUMNS = [
+    ('question', 'question_text', 'TEXT'),
+    ('question', 'correct_answer', 'TEXT'),
+    ('question', 'options', 'JSON'),
+]
+
+NORMALIZE_BATCH_SIZE = 500
+
+
+def upgrade_schema(engine):
+    """Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables, so columns and indexes added to
+    existing tables are applied here. Safe to run repeatedly.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+                logger.info("Added column %s.%s", table, column)
+        for name, table, columns in ADDED_INDEXES:
+            if table not in tables:
+                continue
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+        if 'question' in tables:
+            normalize_question_options(conn)
+            change_column_types(conn, inspector)
+
+
+def normalize_question_options(conn):
+    """Rewrite options that aren't a JSON array (e.g. newline-separated text) as one.
+
+    Options used to be a free-form string column; the JSON column type expects
+    every row to hold a serialized list.
+    """
+    from .utils import process_options
+
+    # SQLite can find the offending rows itself instead of scanning the whole table
+    condition = ''
+    if conn.dialect.name == 'sqlite':
+        condition = " AND (json_valid(options) = 0 OR json_type(options) != 'array')"
+    fixed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            f'SELECT id, options FROM question WHERE id > :last_id{condition} ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': NORMALIZE_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for question_id, options in rows:
+            if not isinstance(options, str):
+                continue  # Already decoded by a native JSON column
+            try:
+                if isinstance(json.loads(options), list):
+                    continue
+            except json.JSONDecodeError:
+                pass
+            updates.append({'id': question_id, 'options': json.dumps(process_options(options))})
+        if updates:
+            conn.execute(text('UPDATE question SET options = :options WHERE id = :id'), updates)
+            fixed += len(updates)
+    if fixed:
+        logger.info("Normalized options of %d question(s)", fixed)
+
+
+def change_column_types(conn, inspector):
+    """Convert columns whose type changed, on databases that enforce column types."""
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        return
+    current = {c['name']: c['type'] for c in inspector.get_columns('question')}
+    for table, column, new_type in CHANGED_COLUMNS:
+        if type(current.get(column)).__name__.upper() == new_type:
+            continue
+        if dialect == 'postgresql':
+            using = f' USING {column}::json' if new_type == 'JSON' else ''
+            conn.execute(text(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {new_type}{using}'))
+        elif dialect == 'mysql':
+            conn.execute(text(f'ALTER TABLE {table} MODIFY {column} {new_type} NOT NULL'))
+        else:
+            continue
+        logger.info("Changed %s.%s to %s", table, column, new_type)
+
+
+if __name__ == '__main__':
+    # Run with: python -m api.migrations
+    from . import create_app
+
+    create_app(start_jobs=False)  # Creates and upgrades the schema
+    print("Database schema is up to date")
@@ -15,6 +15,7 @@ class Lecture(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the uploaded bytes
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     summaries = db.relationship('Summary', backref='lecture', lazy=True)
 
@@ -26,18 +27,69 @@ class Summary(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class QuestionSet(db.Model):
+    __table_args__ = (
+        db.Index('ix_question_set_user_id_created_at', 'user_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='complete', server_default='complete')  # partial while batches are still arriving; failed or cancelled if the job stopped early
+    lecture_id = db.Column(db.Integer, db.ForeignKey('lecture.id'), index=True)  # Uploaded PDF the set was built from
+    model_type = db.Column(db.String(20))  # Processor used to build the set from the lecture
+    num_questions = db.Column(db.Integer)  # Questions requested from the generator
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped whenever the set changes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     questions = db.relationship('Question', backref='question_set', cascade='all, delete-orphan', lazy=True)
 
+    @property
+    def cache_version(self) -> str:
+        """Version used in cache keys; includes the creation time because SQLite reuses deleted IDs."""
+        created = self.created_at.isoformat() if self.created_at else ''
+        return f"{self.version}:{created}"
+
+    def bump_version(self):
+        """Mark the set as changed so cached payloads of the old version are no longer used."""
+        self.version = QuestionSet.version + 1
+
 class Question(db.Model):
+    __table_args__ = (
+        db.Index('ix_question_set_id_id', 'set_id', 'id'),
+        db.Index('ix_question_set_id_chunk_index', 'set_id', 'chunk_index', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    question_text = db.Column(db.String(500), nullable=False)
-    options = db.Column(db.String(500), nullable=False)  # Stored as JSON string
-    correct_answer = db.Column(db.String(500), nullable=False)
+    question_text = db.Column(db.Text, nullable=False)
+    options = db.Column(db.JSON, nullable=False)  # List of option strings
+    correct_answer = db.Column(db.Text, nullable=False)
     set_id = db.Column(db.Integer, db.ForeignKey('question_set.id'), nullable=False)
     source_lecture = db.Column(db.String(255))  # Name of the source lecture file
     page_range = db.Column(db.String(50))  # Page range where the question was generated from
+    chunk_index = db.Column(db.Integer)  # Batch the question came from; batches finish out of order
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    id = db.Column(db.String(36), primary_key=True)  # Upload session ID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, processing, complete, error, cancelled
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    model_type = db.Column(db.String(20), nullable=False, default='extractor')
+    set_name = db.Column(db.String(100), nullable=False)
+    num_questions = db.Column(db.Integer, nullable=False, default=10)
+    file_path = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.String(500))
+    percent = db.Column(db.Float, nullable=False, default=0)
+    error = db.Column(db.Text)
+    set_id = db.Column(db.Integer)  # Question set created by the job once complete
+    lecture_id = db.Column(db.Integer, db.ForeignKey('lecture.id'))  # Uploaded PDF being processed
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker_id = db.Column(db.String(100))  # Process currently running the job
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class JobChunk(db.Model):
+    # Questions produced by each finished chunk, so an interrupted job resumes where it stopped
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), db.ForeignKey('job.id'), nullable=False, index=True)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    questions = db.Column(db.Text, nullable=False)  # Stored as JSON string
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,91 @@
+import gzip
+import json
+import hashlib
+from flask import Response, request
+from .cache import encoded_responses
+
+# Optional accelerators; the standard library is used when they aren't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024  # Smaller bodies aren't worth the CPU or the header overhead
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Good ratio while still fast enough for per-request compression
+
+
+def dumps(obj) -> bytes:
+    """Serialize obj to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def choose_encoding(size: int):
+    """Return the content coding to use for a body of size bytes, or None to send it as is."""
+    if size < MIN_COMPRESS_BYTES:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def make_response(body: bytes, encoding: str = None, status: int = 200) -> Response:
+    response = Response(body, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def json_response(obj, status: int = 200) -> Response:
+    """Serialize obj and compress it if the client accepts it."""
+    body = dumps(obj)
+    encoding = choose_encoding(len(body))
+    return make_response(compress(body, encoding) if encoding else body, encoding, status)
+
+
+def cached_json_response(set_id: int, version: str, build) -> Response:
+    """Return a response for a question set payload that only changes with the set's version.
+
+    The encoded body and each compressed variant are cached, so repeat requests
+    skip serialization and compression; clients that send the ETag back in
+    If-None-Match get a 304 without a body.
+    """
+    entry = encoded_responses.get((set_id, version, None))
+    if entry is None:
+        body = dumps(build())
+        entry = (body, hashlib.sha256(body).hexdigest()[:32])
+        encoded_responses.set((set_id, version, None), entry)
+    body, etag = entry
+
+    if request.if_none_match.contains_weak(etag):
+        response = make_response(b'', status=304)
+    else:
+        encoding = choose_encoding(len(body))
+        if encoding:
+            compressed = encoded_responses.get((set_id, version, encoding))
+            if compressed is None:
+                compressed = compress(body, encoding)
+                encoded_responses.set((set_id, version, encoding), compressed)
+            body = compressed
+        response = make_response(body, encoding)
+    # Weak because the same tag covers every content coding of the payload
+    response.set_etag(etag, weak=True)
+    # The payload belongs to the signed-in user; let browsers keep it but revalidate every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
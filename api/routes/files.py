@@ -1,153 +1,31 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.utils import secure_filename
 import os
 import uuid
 import json
-import shutil
-import threading
 import time
-from ..models import QuestionSet, Question, db
-from ..utils import mcq_extractor, mcq_generator, process_options
+from ..models import Lecture, Job, JobChunk, db
+from ..jobs import find_processed_set, reuse_processed_set
+from ..utils import cleanup_file, hash_file
+from ..uploads import HashingUploadFile, TEMP_FOLDER
+from ..importer import import_questions, QuestionImportError
+from app_logging import get_logger
 
 files_bp = Blueprint('files', __name__)
+logger = get_logger(__name__)
 
-# Dictionary to store progress information
-progress_info = {}
+STREAM_POLL_INTERVAL = 0.5  # Seconds between server-side progress checks
+STREAM_KEEPALIVE = 15  # Seconds of silence before a keep-alive comment is sent
+STREAM_MAX_SECONDS = 300  # Streams are closed after this long; EventSource reconnects automatically
+STREAM_TOKEN_MAX_AGE = 60  # Seconds a stream token can be used to open (or reopen) a stream
+TERMINAL_STATUSES = ('complete', 'error', 'cancelled')
 
-def process_file_async(app, file_path: str, session_id: str, user_id: str, model_type: str):
-    """Process file asynchronously and clean up afterwards."""
-    try:
-        print(f"\nProcessing PDF file: {file_path}")
-        
-        # Get the set name and num_questions from progress info
-        set_name = progress_info[session_id].get('set_name', 'Unnamed Set')
-        num_questions = progress_info[session_id].get('num_questions', 10)  # Default to 10 if not specified
-        
-        # Initialize progress
-        progress_info[session_id].update({
-            'status': 'processing',
-            'message': 'Starting processing...',
-            'percent': 0,
-            'completed': False,
-            'questions_saved': False
-        })
-        
-        # Create a temporary copy of the file
-        temp_file = f"{file_path}.temp"
-        shutil.copy2(file_path, temp_file)
-        print(f"Created temporary PDF: {temp_file}")
-        
-        try:
-            # Extract text from PDF
-            processor = mcq_generator if model_type == 'generator' else mcq_extractor
-            pdf_text = processor.extract_text_from_pdf(temp_file)
-            progress_info[session_id].update({
-                'message': 'Extracted text from PDF, processing questions...',
-                'percent': 20
-            })
-            
-            if not pdf_text.strip():
-                raise Exception("No text could be extracted from the PDF file")
-            
-            # Extract questions using AI
-            def progress_callback(message, current, total):
-                percent = 20 + (current / total * 60)  # Scale to 20-80%
-                progress_info[session_id].update({
-                    'message': message,
-                    'percent': percent
-                })
-            
-            processor.set_progress_callback(progress_callback)
-            
-            if model_type == 'generator':
-                # Generator handles text extraction internally in process_lecture
-                questions = {'questions': processor.process_lecture(temp_file, questions_per_chunk=num_questions)}
-            else:
-                # For extractor, we need to extract text first
-                pdf_text = processor.extract_text_from_pdf(temp_file)
-                if not pdf_text.strip():
-                    raise Exception("No text could be extracted from the PDF file")
-                questions = processor.extract_mcqs_with_ai(pdf_text)
-            
-            if not questions or not questions.get('questions'):
-                raise Exception("No questions were extracted from the file")
-            
-            progress_info[session_id].update({
-                'message': 'Saving questions to database...',
-                'percent': 80
-            })
-            
-            # Save questions to database with the set name and user_id within app context
-            with app.app_context():
-                question_set = QuestionSet(name=set_name, user_id=int(user_id))
-                db.session.add(question_set)
-                db.session.commit()
-                
-                for q in questions['questions']:
-                    # Ensure options are stored as a JSON string
-                    options = process_options(q['options'])
-                    options_json = json.dumps(options) if isinstance(options, list) else options
-                    
-                    question = Question(
-                        question_text=q['question'],
-                        options=options_json,
-                        correct_answer=q['correct_answer'],
-                        set_id=question_set.id,
-                        source_lecture=q.get('source_lecture', ''),
-                        page_range=q.get('page_range', '')
-                    )
-                    db.session.add(question)
-                
-                db.session.commit()
-                print(f"Saved {len(questions['questions'])} questions to database with set name: {set_name}")
-                
-                progress_info[session_id].update({
-                    'status': 'complete',
-                    'message': f'Successfully processed {len(questions["questions"])} questions',
-                    'questions': questions['questions'],
-                    'completed': True,
-                    'questions_saved': True,
-                    'set_id': question_set.id,
-                    'percent': 100
-                })
-            
-        except Exception as e:
-            print(f"Error processing file: {str(e)}")
-            progress_info[session_id].update({
-                'status': 'error',
-                'message': str(e),
-                'error': str(e),
-                'completed': True,
-                'percent': 100
-            })
-            raise
-        finally:
-            # Clean up temporary file
-            cleanup_file(temp_file)
-            print(f"Cleaned up temporary PDF: {temp_file}")
-            
-    except Exception as e:
-        print(f"Error in process_file_async: {str(e)}")
-        progress_info[session_id].update({
-            'status': 'error',
-            'message': str(e),
-            'error': str(e),
-            'completed': True,
-            'percent': 100
-        })
-    finally:
-        # Clean up original file
-        cleanup_file(file_path)
-
-def cleanup_file(file_path):
-    """Clean up a file if it exists."""
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Cleaned up file: {file_path}")
-    except Exception as e:
-        print(f"Error cleaning up file {file_path}: {str(e)}")
+def sse_event(event: str, data: str, event_id: int = None) -> str:
+    """Format a server-sent event from an already JSON-encoded payload."""
+    id_line = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{id_line}event: {event}\ndata: {data}\n\n"
 
 @files_bp.route('/api/upload-file', methods=['POST'])
 @jwt_required()
@@ -174,51 +52,16 @@ def upload_file():
         
         # Check if it's a JSON file
         if file.filename.endswith('.json'):
+            # Parse and insert incrementally so large banks are never held in memory at once
             try:
-                # Read and validate JSON content
-                json_data = json.loads(file.read().decode('utf-8'))
-                
-                if not isinstance(json_data, dict) or 'questions' not in json_data:
-                    return jsonify({'error': 'Invalid JSON format. Must contain a "questions" array'}), 400
-                
-                questions = json_data['questions']
-                if not isinstance(questions, list):
-                    return jsonify({'error': 'Questions must be an array'}), 400
-                
-                # Validate each question
-                for q in questions:
-                    if not all(k in q for k in ('question', 'options', 'correct_answer')):
-                        return jsonify({'error': 'Each question must have question, options, and correct_answer'}), 400
-                    if not isinstance(q['options'], list):
-                        return jsonify({'error': 'Options must be an array'}), 400
-                    if q['correct_answer'] not in q['options']:
-                        return jsonify({'error': 'Correct answer must be one of the options'}), 400
-                
-                # Save questions to database
-                question_set = QuestionSet(name=set_name, user_id=int(current_user_id))
-                db.session.add(question_set)
-                db.session.commit()
-                
-                for q in questions:
-                    options_json = json.dumps(q['options'])
-                    question = Question(
-                        question_text=q['question'],
-                        options=options_json,
-                        correct_answer=q['correct_answer'],
-                        set_id=question_set.id,
-                        source_lecture=q.get('source_lecture', ''),
-                        page_range=q.get('page_range', '')
-                    )
-                    db.session.add(question)
-                
-                db.session.commit()
+                _, imported = import_questions(file.stream, int(current_user_id), set_name=set_name)
                 return jsonify({
-                    'message': f'Successfully imported {len(questions)} questions from JSON',
-                    'questions_imported': len(questions)
+                    'message': f'Successfully imported {imported} questions from JSON',
+                    'questions_imported': imported
                 })
                 
-            except json.JSONDecodeError:
-                return jsonify({'error': 'Invalid JSON file'}), 400
+            except QuestionImportError as e:
+                return jsonify({'error': str(e), 'index': e.index}), 400
             except Exception as e:
                 return jsonify({'error': f'Error processing JSON: {str(e)}'}), 400
         
@@ -227,40 +70,55 @@ def upload_file():
             return jsonify({'error': 'Only PDF and JSON files are supported'}), 400
         
         # Ensure TEMP_FOLDER exists
-        temp_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'temp')
-        os.makedirs(temp_folder, exist_ok=True)
+        os.makedirs(TEMP_FOLDER, exist_ok=True)
             
         # Generate a unique session ID
         session_id = str(uuid.uuid4())
         
-        # Save the file
+        # Save the file; uploads are streamed to disk and hashed while the request is read
         filename = secure_filename(file.filename)
-        file_path = os.path.join(temp_folder, f"{session_id}_{filename}")
-        file.save(file_path)
-        print(f"File saved successfully to: {file_path}")
-        
-        # Initialize progress tracking with set name and timestamp
-        progress_info[session_id] = {
-            'status': 'uploading',
-            'message': 'File upload started...',
-            'percent': 0,
-            'set_name': set_name,
-            'num_questions': num_questions,  # Store num_questions in progress info
-            'model_type': model_type,
-            'timestamp': time.time(),
-            'completed': False,
-            'error': None,
-            'file_path': file_path
-        }
-        print(f"Initialized progress tracking for session {session_id}")
-        
-        # Get the current app
-        from flask import current_app
-        app = current_app._get_current_object()
+        file_path = os.path.join(TEMP_FOLDER, f"{session_id}_{filename}")
+        if isinstance(file.stream, HashingUploadFile):
+            if not file.stream.is_pdf:
+                return jsonify({'error': 'The uploaded file is not a valid PDF'}), 400
+            file.stream.persist(file_path)
+            content_hash = file.stream.hexdigest()
+        else:
+            file.save(file_path)
+            content_hash = hash_file(file_path)
+        logger.info("File saved successfully to: %s", file_path)
+
+        # Identical bytes processed before with the same settings are served from the existing set
+        lecture = Lecture(
+            user_id=int(current_user_id),
+            filename=filename,
+            file_path=file_path,
+            content_hash=content_hash
+        )
+        db.session.add(lecture)
+        db.session.flush()
+        existing = find_processed_set(lecture.content_hash, model_type, num_questions)
+        if existing is not None:
+            reuse_processed_set(existing, session_id, int(current_user_id), set_name, lecture.id, file_path)
+            cleanup_file(file_path)
+            logger.info("Reused question set %s for identical upload in session %s", existing.id, session_id)
+            return jsonify({
+                'message': 'File upload started',
+                'session_id': session_id
+            }), 200
         
-        # Start processing in a separate thread
-        thread = threading.Thread(target=process_file_async, args=(app, file_path, session_id, str(current_user_id), model_type))
-        thread.start()
+        # Queue the job; a dispatcher picks it up and survives restarts. Priority is
+        # derived from the user's backlog rather than taken from the request.
+        current_app.extensions['job_queue'].enqueue(
+            user_id=int(current_user_id),
+            file_path=file_path,
+            set_name=set_name,
+            model_type=model_type,
+            num_questions=num_questions,
+            job_id=session_id,
+            lecture_id=lecture.id
+        )
+        logger.info("Queued processing job for session %s", session_id)
         
         return jsonify({
             'message': 'File upload started',
@@ -268,14 +126,154 @@ def upload_file():
         }), 200
         
     except Exception as e:
-        print(f"Error in upload_file: {str(e)}")
+        logger.exception("Error in upload_file: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @files_bp.route('/api/upload-progress/<session_id>', methods=['GET'])
 @jwt_required()
 def get_progress(session_id):
     """Get the progress of a file upload session."""
-    if session_id not in progress_info:
+    current_user_id = get_jwt_identity()
+    job = Job.query.filter_by(id=session_id, user_id=int(current_user_id)).first()
+    if not job:
         return jsonify({'error': 'Session not found'}), 404
-        
-    return jsonify(progress_info[session_id])
+    
+    progress = {
+        'status': job.status,
+        'message': job.message,
+        'percent': job.percent,
+        'set_name': job.set_name,
+        'model_type': job.model_type,
+        'completed': job.status in TERMINAL_STATUSES,
+        'error': job.error,
+        'set_id': job.set_id
+    }
+    if job.status == 'complete' and job.set_id:
+        progress['questions_saved'] = True
+    return jsonify(progress)
+
+def get_stream_token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='upload-progress-stream')
+
+@files_bp.route('/api/upload-progress/<session_id>/stream-token', methods=['POST'])
+@jwt_required()
+def create_stream_token(session_id):
+    """Issue a short-lived token that can only open the progress stream of one session.
+
+    EventSource cannot send headers, so the stream is authorized through the URL;
+    this keeps the long-lived access token out of URLs and access logs.
+    """
+    current_user_id = int(get_jwt_identity())
+    if not Job.query.with_entities(Job.id).filter_by(id=session_id, user_id=current_user_id).first():
+        return jsonify({'error': 'Session not found'}), 404
+    token = get_stream_token_serializer().dumps({'user_id': current_user_id, 'session_id': session_id})
+    return jsonify({'token': token, 'expires_in': STREAM_TOKEN_MAX_AGE}), 200
+
+@files_bp.route('/api/upload-progress/<session_id>/stream', methods=['GET'])
+def stream_progress(session_id):
+    """Stream progress deltas and per-batch questions as server-sent events.
+
+    Authorized by a ?token= from create_stream_token, or by the usual
+    Authorization header for clients that can send one. It is verified once
+    when the stream opens rather than on every update.
+
+    Question events carry their JobChunk ID as the event ID, so a reconnecting
+    client (Last-Event-ID header, or ?last_event_id= when it opens a new
+    EventSource) only receives batches it hasn't seen.
+
+    Each open stream occupies a server worker thread for up to
+    STREAM_MAX_SECONDS and runs two small indexed queries every
+    STREAM_POLL_INTERVAL; size the server's thread count for the expected
+    number of concurrent uploads.
+    """
+    token = request.args.get('token')
+    if token is None:
+        verify_jwt_in_request()
+        current_user_id = int(get_jwt_identity())
+    else:
+        try:
+            claims = get_stream_token_serializer().loads(token, max_age=STREAM_TOKEN_MAX_AGE)
+        except BadSignature:  # Also raised for expired tokens
+            return jsonify({'error': 'Invalid or expired stream token'}), 401
+        if claims.get('session_id') != session_id:
+            return jsonify({'error': 'Invalid or expired stream token'}), 401
+        current_user_id = claims['user_id']
+    if not Job.query.with_entities(Job.id).filter_by(id=session_id, user_id=current_user_id).first():
+        return jsonify({'error': 'Session not found'}), 404
+
+    try:
+        last_chunk_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_chunk_id = 0
+
+    def events():
+        nonlocal last_chunk_id
+        last_state = {}
+        started = last_sent = time.monotonic()
+        yield "retry: 2000\n\n"
+
+        while True:
+            job = Job.query.with_entities(
+                Job.status, Job.message, Job.percent, Job.set_id, Job.error
+            ).filter_by(id=session_id).first()
+            if job is None:
+                yield sse_event('error', json.dumps({'message': 'Session not found'}))
+                return
+
+            # Only send the fields that changed since the last event
+            state = {'status': job.status, 'message': job.message, 'percent': round(job.percent, 1)}
+            delta = {k: v for k, v in state.items() if last_state.get(k) != v}
+            if delta:
+                last_state.update(delta)
+                yield sse_event('progress', json.dumps(delta))
+                last_sent = time.monotonic()
+
+            # Questions from each finished batch, passed through without re-encoding
+            chunks = JobChunk.query.with_entities(JobChunk.id, JobChunk.chunk_index, JobChunk.questions).filter(
+                JobChunk.job_id == session_id, JobChunk.id > last_chunk_id
+            ).order_by(JobChunk.id).all()
+            for chunk_id, chunk_index, questions_json in chunks:
+                last_chunk_id = chunk_id
+                yield sse_event('questions', f'{{"chunk_index": {chunk_index}, "questions": {questions_json}}}', chunk_id)
+                last_sent = time.monotonic()
+
+            # End the read transaction so the next poll sees new commits
+            db.session.rollback()
+
+            if job.status in TERMINAL_STATUSES:
+                yield sse_event(job.status, json.dumps({
+                    'message': job.message,
+                    'set_id': job.set_id,
+                    'error': job.error
+                }))
+                return
+
+            now = time.monotonic()
+            if now - started > STREAM_MAX_SECONDS:
+                return
+            if now - last_sent > STREAM_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_sent = now
+            time.sleep(STREAM_POLL_INTERVAL)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering so events arrive immediately
+    })
+
+@files_bp.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_job(job_id):
+    """Cancel a queued or running upload job."""
+    current_user_id = get_jwt_identity()
+    if not current_app.extensions['job_queue'].cancel(job_id, int(current_user_id)):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify({'message': 'Cancellation requested', 'session_id': job_id}), 200
+
+@files_bp.route('/api/jobs/metrics', methods=['GET'])
+@jwt_required()
+def job_metrics():
+    """Report queue depth and job counts; restricted to ADMIN_USER_IDS."""
+    if int(get_jwt_identity()) not in current_app.config['ADMIN_USER_IDS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(current_app.extensions['job_queue'].metrics()), 200
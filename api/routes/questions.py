@@ -1,22 +1,58 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func
 from ..models import QuestionSet, Question, db
 from ..utils import process_options
-import json
+from ..importer import import_questions, QuestionImportError
+from ..cache import get_set_cache
 
 questions_bp = Blueprint('questions', __name__)
 
+DEFAULT_SETS_PER_PAGE = 20
+MAX_SETS_PER_PAGE = 100
+SET_SORT_FIELDS = ('id', 'name', 'created_at', 'question_count')
+
 @questions_bp.route('/api/question-sets', methods=['GET'])
 @jwt_required()
 def get_question_sets():
-    current_user_id = get_jwt_identity()
-    sets = QuestionSet.query.filter_by(user_id=int(current_user_id)).all()
-    return jsonify([{
+    """List the user's question sets with their question counts.
+
+    Counts come from one grouped query. Optional ?page=&per_page= paginate the
+    list, ?sort= and ?order= sort it; the total number of sets is returned in the
+    X-Total-Count header.
+    """
+    current_user_id = int(get_jwt_identity())
+    sort = request.args.get('sort', 'id')
+    order = request.args.get('order', 'asc')
+    if sort not in SET_SORT_FIELDS or order not in ('asc', 'desc'):
+        return jsonify({'error': f"sort must be one of {', '.join(SET_SORT_FIELDS)} and order asc or desc"}), 400
+
+    question_count = func.count(Question.id).label('question_count')
+    query = db.session.query(
+        QuestionSet.id, QuestionSet.name, QuestionSet.status, QuestionSet.created_at, question_count
+    ).outerjoin(Question, Question.set_id == QuestionSet.id).filter(
+        QuestionSet.user_id == current_user_id
+    ).group_by(QuestionSet.id)
+
+    sort_column = question_count if sort == 'question_count' else getattr(QuestionSet, sort)
+    sort_column = sort_column.desc() if order == 'desc' else sort_column.asc()
+    query = query.order_by(sort_column, QuestionSet.id.asc())
+
+    if 'page' in request.args or 'per_page' in request.args:
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = max(1, min(MAX_SETS_PER_PAGE, request.args.get('per_page', DEFAULT_SETS_PER_PAGE, type=int)))
+        query = query.limit(per_page).offset((page - 1) * per_page)
+
+    total = QuestionSet.query.filter_by(user_id=current_user_id).count()
+    response = jsonify([{
         'id': s.id,
         'name': s.name,
+        'status': s.status,
         'created_at': s.created_at.isoformat(),
-        'question_count': len(s.questions)
-    } for s in sets]), 200
+        'question_count': s.question_count
+    } for s in query.all()])
+    response.headers['X-Total-Count'] = str(total)
+    return response, 200
 
 @questions_bp.route('/api/question-sets/<int:set_id>', methods=['DELETE'])
 @jwt_required()
@@ -30,6 +66,7 @@ def delete_set(set_id):
     try:
         db.session.delete(question_set)
         db.session.commit()
+        get_set_cache().invalidate(set_id)
         return jsonify({'message': 'Question set deleted successfully'}), 200
     except Exception as e:
         db.session.rollback()
@@ -51,7 +88,9 @@ def update_set_name(set_id):
     
     try:
         question_set.name = data['name']
+        question_set.bump_version()
         db.session.commit()
+        get_set_cache().invalidate(set_id)
         return jsonify({
             'message': 'Question set name updated successfully',
             'id': question_set.id,
@@ -65,37 +104,17 @@ def update_set_name(set_id):
 @jwt_required()
 def upload_questions():
     current_user_id = get_jwt_identity()
-    data = request.get_json()
-    
-    if not all(key in data for key in ['name', 'questions']):
-        return jsonify({'error': 'Missing required fields'}), 400
     
     try:
-        # Create new question set
-        question_set = QuestionSet(name=data['name'], user_id=int(current_user_id))
-        db.session.add(question_set)
-        db.session.commit()
-        
-        # Add questions to the set
-        for q in data['questions']:
-            if not all(key in q for key in ['question', 'options', 'correct_answer']):
-                return jsonify({'error': 'Invalid question format'}), 400
-            
-            options_json = process_options(q['options'])
-            question = Question(
-                question_text=q['question'],
-                options=options_json,
-                correct_answer=q['correct_answer'],
-                set_id=question_set.id
-            )
-            db.session.add(question)
-        
-        db.session.commit()
+        # The body is parsed incrementally rather than loaded with get_json()
+        question_set, _ = import_questions(request.stream, int(current_user_id), strict=False)
         return jsonify({
             'message': 'Questions uploaded successfully',
             'set_id': question_set.id
         }), 201
         
+    except QuestionImportError as e:
+        return jsonify({'error': str(e), 'index': e.index}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1,10 +1,69 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func
 from ..models import QuestionSet, Question, db
-import json
+from ..cache import answer_keys, get_set_cache
+from ..responses import json_response, cached_json_response
+from app_logging import get_logger
+from bisect import bisect_right
+from itertools import accumulate
 import random
 
 quiz_bp = Blueprint('quiz', __name__)
+logger = get_logger(__name__)
+
+ANSWER_LOG_SAMPLE_RATE = 0.01  # Answer checks run once per click; keep a sample of their debug lines
+
+def load_set_questions(set_id: int) -> list:
+    """Read a set's questions from the database as plain dicts, in document order."""
+    return [{
+        'id': q.id,
+        'question': q.question_text,
+        'options': list(q.options),
+        'correct_answer': q.correct_answer
+    } for q in db.session.query(
+        Question.id, Question.question_text, Question.options, Question.correct_answer
+    ).filter(Question.set_id == set_id).order_by(Question.chunk_index, Question.id)]
+
+def get_set_questions(question_set: QuestionSet) -> list:
+    """Return a set's questions, served from the set cache once the set is complete.
+
+    The returned dicts are shared between requests and must not be modified.
+    """
+    if question_set.status != 'complete':
+        return load_set_questions(question_set.id)
+    return get_set_cache().get_or_load(
+        question_set.id, question_set.cache_version, lambda: load_set_questions(question_set.id)
+    )
+
+def parse_question_ids(items: list):
+    """Return the question IDs of submitted answers as ints, or None if any is invalid."""
+    try:
+        return [int(item['question_id']) for item in items]
+    except (TypeError, ValueError):
+        return None
+
+def get_answer_key(question_set: QuestionSet, question_ids: list):
+    """Return ({question ID: (question text, correct answer)}, total questions in the set).
+
+    Completed sets are built once from the cached set payload and kept in the
+    answer-key cache; sets still being generated are looked up with a single IN query.
+    """
+    if question_set.status == 'complete':
+        key = (question_set.id, question_set.cache_version)
+        answer_key = answer_keys.get(key)
+        if answer_key is None:
+            answer_key = {q['id']: (q['question'], q['correct_answer']) for q in get_set_questions(question_set)}
+            answer_keys.set(key, answer_key)
+        return answer_key, len(answer_key)
+
+    answer_key = {
+        q.id: (q.question_text, q.correct_answer)
+        for q in db.session.query(Question.id, Question.question_text, Question.correct_answer)
+        .filter(Question.set_id == question_set.id, Question.id.in_(question_ids))
+    }
+    total = db.session.query(func.count(Question.id)).filter(Question.set_id == question_set.id).scalar()
+    return answer_key, total
 
 @quiz_bp.route('/api/get_quiz', methods=['POST'])
 @jwt_required()
@@ -12,59 +71,55 @@ def get_quiz():
     current_user_id = get_jwt_identity()
     data = request.get_json()
     
-    print("Quiz request data:", data)  # Debug log
+    logger.debug("Quiz request data: %s", data)
     
     if not data or 'selected_sets' not in data:
         return jsonify({'error': 'No question sets selected'}), 400
         
-    selected_sets = data['selected_sets']
-    questions_per_quiz = data.get('questions_per_quiz', 40)
-    
-    # Get all questions from selected sets that belong to the user
+    try:
+        selected_sets = [int(set_id) for set_id in data['selected_sets']]
+        questions_per_quiz = int(data.get('questions_per_quiz', 40))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'selected_sets must be a list of set IDs'}), 400
+    
+    # Completed sets come from the set cache, so a class starting the same quiz
+    # doesn't reload and decode the set on every request
+    question_sets = QuestionSet.query.filter(
+        QuestionSet.id.in_(selected_sets),
+        QuestionSet.user_id == int(current_user_id)
+    ).all()
+    set_questions = [(question_set.id, get_set_questions(question_set)) for question_set in question_sets]
+    # Sample positions across the cached lists instead of copying every question into one pool
+    ends = list(accumulate(len(set_qs) for _, set_qs in set_questions))
+    total = ends[-1] if ends else 0
+    positions = random.sample(range(total), min(max(0, questions_per_quiz), total))
+
+    # Options are shuffled into new lists; the cached payloads are shared
     questions = []
-    for set_id in selected_sets:
-        print(f"Fetching questions for set {set_id}")  # Debug log
-        question_set = QuestionSet.query.filter_by(id=set_id, user_id=int(current_user_id)).first()
-        if question_set:
-            print(f"Found set {set_id} with {len(question_set.questions)} questions")  # Debug log
-            for q in question_set.questions:
-                try:
-                    options = json.loads(q.options) if isinstance(q.options, str) else q.options
-                    print(f"Question {q.id} options:", options)  # Debug log
-                    questions.append({
-                        'id': q.id,
-                        'question': q.question_text,
-                        'options': options,
-                        'set_id': q.set_id
-                    })
-                except Exception as e:
-                    print(f"Error processing question {q.id}:", str(e))  # Debug log
-                    continue
+    for position in positions:
+        i = bisect_right(ends, position)
+        set_id, set_qs = set_questions[i]
+        q = set_qs[position - (ends[i - 1] if i else 0)]
+        questions.append({
+            'id': q['id'],
+            'question': q['question'],
+            'options': random.sample(q['options'], len(q['options'])),
+            'set_id': set_id
+        })
     
     if not questions:
         return jsonify({'error': 'No questions found in selected sets'}), 404
     
-    print(f"Total questions before shuffle: {len(questions)}")  # Debug log
-    
-    # Shuffle questions and limit to requested number
-    random.shuffle(questions)
-    questions = questions[:questions_per_quiz]
+    logger.debug("Returning %d questions", len(questions))
     
-    print(f"Returning {len(questions)} questions")  # Debug log
-    print("First question sample:", questions[0] if questions else None)  # Debug log
-    
-    # Shuffle options for each question
-    for q in questions:
-        random.shuffle(q['options'])
-    
-    return jsonify(questions)
+    return json_response(questions)
 
 @quiz_bp.route('/api/quiz/check', methods=['POST'])
 @jwt_required()
 def check_answer():
     data = request.get_json()
     
-    print("Check answer request data:", data)  # Debug log
+    logger.debug("Check answer request data: %s", data, extra={'sample_rate': ANSWER_LOG_SAMPLE_RATE})
     
     if not all(key in data for key in ['question_id', 'answer']):
         return jsonify({'error': 'Missing required fields'}), 400
@@ -73,7 +128,8 @@ def check_answer():
     if not question:
         return jsonify({'error': 'Question not found'}), 404
     
-    print(f"Checking answer for question {data['question_id']}")  # Debug log
+    logger.debug("Checking answer for question %s", data['question_id'],
+                 extra={'sample_rate': ANSWER_LOG_SAMPLE_RATE})
     
     is_correct = data['answer'] == question.correct_answer
     return jsonify({
@@ -86,48 +142,47 @@ def check_answer():
 def submit_quiz():
     data = request.get_json()
     
-    print("Submit quiz request data:", data)  # Debug log
-    
     if not all(key in data for key in ['set_id', 'answers']):
         return jsonify({'error': 'Missing required fields'}), 400
     
     current_user_id = get_jwt_identity()
-    question_set = QuestionSet.query.filter_by(id=data['set_id'], user_id=current_user_id).first()
+    question_set = QuestionSet.query.filter_by(id=data['set_id'], user_id=int(current_user_id)).first()
     
     if not question_set:
         return jsonify({'error': 'Question set not found'}), 404
     
-    print(f"Processing quiz submission for set {data['set_id']}")  # Debug log
+    logger.debug("Processing quiz submission for set %s with %d answers", data['set_id'], len(data['answers']))
+    
+    if not all(key in answer for answer in data['answers'] for key in ['question_id', 'selected_answer']):
+        return jsonify({'error': 'Invalid answer format'}), 400
+    
+    question_ids = parse_question_ids(data['answers'])
+    if question_ids is None:
+        return jsonify({'error': 'Invalid answer format'}), 400
+    
+    # Grade every answer against one lookup of the set's answer key
+    answer_key, total_questions = get_answer_key(question_set, question_ids)
     
     results = []
     correct_count = 0
-    total_questions = len(question_set.questions)
-    
-    # Process each answer
-    for answer in data['answers']:
-        print(f"Processing answer for question {answer['question_id']}")  # Debug log
-        
-        if not all(key in answer for key in ['question_id', 'selected_answer']):
-            return jsonify({'error': 'Invalid answer format'}), 400
-        
-        question = Question.query.get(answer['question_id'])
-        if not question or question.set_id != question_set.id:
+    for question_id, answer in zip(question_ids, data['answers']):
+        entry = answer_key.get(question_id)
+        if entry is None:
             return jsonify({'error': f'Question {answer["question_id"]} not found in set'}), 404
         
-        is_correct = answer['selected_answer'] == question.correct_answer
+        question_text, correct_answer = entry
+        is_correct = answer['selected_answer'] == correct_answer
         if is_correct:
             correct_count += 1
         
         results.append({
-            'question_id': question.id,
-            'question_text': question.question_text,
+            'question_id': question_id,
+            'question_text': question_text,
             'selected_answer': answer['selected_answer'],
-            'correct_answer': question.correct_answer,
+            'correct_answer': correct_answer,
             'is_correct': is_correct
         })
     
-    print(f"Quiz submission results: {results}")  # Debug log
-    
     # Calculate score
     score = (correct_count / total_questions) * 100 if total_questions > 0 else 0
     
@@ -147,61 +202,58 @@ def review_incorrect(set_id):
     if not question_set:
         return jsonify({'error': 'Question set not found'}), 404
     
-    print(f"Fetching questions for review in set {set_id}")  # Debug log
+    logger.debug("Fetching questions for review in set %s", set_id)
     
-    questions = []
-    for q in question_set.questions:
-        question_dict = {
-            'id': q.id,
-            'question': q.question_text,
-            'options': json.loads(q.options),
-            'correct_answer': q.correct_answer
+    def build():
+        return {
+            'set_id': set_id,
+            'name': question_set.name,
+            'questions': get_set_questions(question_set)
         }
-        questions.append(question_dict)
     
-    return jsonify({
-        'set_id': set_id,
-        'name': question_set.name,
-        'questions': questions
-    }), 200
+    if question_set.status != 'complete':
+        return json_response(build())  # Still growing; the version doesn't change per batch
+    return cached_json_response(set_id, question_set.cache_version, build)
 
 @quiz_bp.route('/api/submit_review', methods=['POST'])
 @jwt_required()
 def submit_review():
     data = request.get_json()
     
-    print("Submit review request data:", data)  # Debug log
+    logger.debug("Submit review request data: %s", data)
     
     if not all(key in data for key in ['set_id', 'reviews']):
         return jsonify({'error': 'Missing required fields'}), 400
     
     current_user_id = get_jwt_identity()
-    question_set = QuestionSet.query.filter_by(id=data['set_id'], user_id=current_user_id).first()
+    question_set = QuestionSet.query.filter_by(id=data['set_id'], user_id=int(current_user_id)).first()
     
     if not question_set:
         return jsonify({'error': 'Question set not found'}), 404
     
-    print(f"Processing review submission for set {data['set_id']}")  # Debug log
+    logger.debug("Processing review submission for set %s", data['set_id'])
+    
+    if not all(key in review for review in data['reviews'] for key in ['question_id', 'understood']):
+        return jsonify({'error': 'Invalid review format'}), 400
+    
+    question_ids = parse_question_ids(data['reviews'])
+    if question_ids is None:
+        return jsonify({'error': 'Invalid review format'}), 400
+    
+    answer_key, _ = get_answer_key(question_set, question_ids)
     
     results = []
-    for review in data['reviews']:
-        print(f"Processing review for question {review['question_id']}")  # Debug log
-        
-        if not all(key in review for key in ['question_id', 'understood']):
-            return jsonify({'error': 'Invalid review format'}), 400
-        
-        question = Question.query.get(review['question_id'])
-        if not question or question.set_id != question_set.id:
+    for question_id, review in zip(question_ids, data['reviews']):
+        entry = answer_key.get(question_id)
+        if entry is None:
             return jsonify({'error': f'Question {review["question_id"]} not found in set'}), 404
         
         results.append({
-            'question_id': question.id,
-            'question_text': question.question_text,
+            'question_id': question_id,
+            'question_text': entry[0],
             'understood': review['understood']
         })
     
-    print(f"Review submission results: {results}")  # Debug log
-    
     return jsonify({
         'message': 'Review submitted successfully',
         'results': results
@@ -0,0 +1,71 @@
+import os
+import uuid
+import hashlib
+import shutil
+from flask import Request
+
+# Uploads are streamed here, next to where the routes keep files while they are processed
+TEMP_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'temp')
+PDF_MAGIC = b'%PDF-'
+
+
+class HashingUploadFile:
+    """Writable upload target that streams a file part straight to disk.
+
+    The SHA-256 of the content is computed while it is written, and PDF uploads
+    are checked for the %PDF- header as soon as the first bytes arrive; once a
+    PDF fails that check nothing more is written. The file is deleted on close
+    unless it was kept with persist().
+    """
+
+    def __init__(self, folder: str, filename: str = None):
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"upload-{uuid.uuid4().hex}.part")
+        self.expects_pdf = bool(filename) and filename.lower().endswith('.pdf')
+        self.is_pdf = None  # Unknown until the first bytes arrive
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._header = b''
+        self._file = open(self.path, 'w+b')
+        self._kept = False
+
+    def write(self, data: bytes) -> int:
+        if self.expects_pdf and self.is_pdf is None:
+            self._header += data[:len(PDF_MAGIC) - len(self._header)]
+            if len(self._header) >= len(PDF_MAGIC) or not data:
+                self.is_pdf = self._header.startswith(PDF_MAGIC)
+        if self.is_pdf is False:
+            # Not a PDF; the route rejects it, so don't spend disk or CPU on the rest
+            return len(data)
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def persist(self, destination: str) -> str:
+        """Close the upload and move it to destination, keeping it after the request ends."""
+        self._file.close()
+        try:
+            os.replace(self.path, destination)
+        except OSError:
+            shutil.move(self.path, destination)  # Different filesystem
+        self._kept = True
+        return destination
+
+    def close(self):
+        self._file.close()
+        if not self._kept and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # seek, read, tell, etc. are used by Werkzeug and FileStorage
+        return getattr(self._file, name)
+
+
+class StreamingUploadRequest(Request):
+    """Request class that streams file uploads to disk instead of buffering them."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUploadFile(TEMP_FOLDER, filename)
@@ -2,15 +2,12 @@ import os
 import shutil
 import time
 import json
-from mcq_extractor import MCQExtractor
-from mcq_generator import MCQGenerator
+import hashlib
+from app_logging import get_logger
 
-# Initialize MCQ processors
-mcq_extractor = MCQExtractor()
-mcq_generator = MCQGenerator()
+logger = get_logger(__name__)
 
-# Store progress information with TTL
-progress_info = {}
+# Age after which leftover temp and upload files are removed
 PROGRESS_TTL = 3600  # 1 hour in seconds
 
 def cleanup_file(filepath: str):
@@ -23,22 +20,11 @@ def cleanup_file(filepath: str):
                 elif os.path.isdir(filepath):
                     shutil.rmtree(filepath, ignore_errors=True)
             except PermissionError:
-                print(f"Permission denied when cleaning up {filepath} - will be cleaned up later")
+                logger.warning("Permission denied when cleaning up %s - will be cleaned up later", filepath)
             except Exception as e:
-                print(f"Error cleaning up {filepath}: {str(e)}")
+                logger.warning("Error cleaning up %s: %s", filepath, e)
     except Exception as e:
-        print(f"Error checking file {filepath}: {str(e)}")
-
-def cleanup_old_progress():
-    """Clean up progress info older than TTL"""
-    current_time = time.time()
-    expired_sessions = [
-        session_id for session_id, info in progress_info.items()
-        if info.get('timestamp', 0) + PROGRESS_TTL < current_time or
-        (info.get('completed', False) and info.get('timestamp', 0) + 60 < current_time)
-    ]
-    for session_id in expired_sessions:
-        del progress_info[session_id]
+        logger.warning("Error checking file %s: %s", filepath, e)
 
 def cleanup_temp_files(temp_folder, upload_folder):
     """Clean up old files in temp and uploads directories"""
@@ -57,9 +43,17 @@ def cleanup_temp_files(temp_folder, upload_folder):
                     except OSError:
                         cleanup_file(filepath)
                 except Exception as e:
-                    print(f"Error processing file {filename}: {str(e)}")
+                    logger.warning("Error processing file %s: %s", filename, e)
         except Exception as e:
-            print(f"Error accessing directory {directory}: {str(e)}")
+            logger.warning("Error accessing directory %s: %s", directory, e)
+
+def hash_file(filepath: str, block_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
 def process_options(options):
     """Process options to ensure they are in a consistent format
@@ -68,7 +62,7 @@ def process_options(options):
         options: Can be a string (JSON or newline-separated) or a list
         
     Returns:
-        list: A list of options, ready to be JSON serialized before database storage
+        list: A list of options, ready to be stored in the JSON options column
     """
     if isinstance(options, str):
         try:
@@ -82,13 +76,3 @@ def process_options(options):
         return options
     else:
         raise ValueError("Options must be either a JSON string or a list")
-
-def process_file_with_model(file_path: str, model_type: str, progress_callback=None):
-    """Process file with the selected model"""
-    if model_type == 'generator':
-        processor = mcq_generator
-    else:  # default to extractor
-        processor = mcq_extractor
-        
-    processor.set_progress_callback(progress_callback)
-    return processor.process_lecture(file_path)
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Defaults can be overridden through the environment
+DEFAULT_LOG_LEVEL = 'INFO'
+DEFAULT_LOG_FORMAT = 'text'  # 'text' or 'json'
+DEFAULT_SAMPLE_RATE = 1.0  # Fraction of sampled records (below WARNING) that are kept
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+# Credentials that can appear in request URLs (EventSource streams can't send headers)
+QUERY_SECRET_PATTERN = re.compile(r'\b((?:jwt|token)=)[^&\s"]+')
+
+# Attributes every LogRecord has; anything else was passed through extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of low-severity records.
+
+    Records can set their own rate with extra={'sample_rate': 0.01}; others use
+    the default. Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rate: float = DEFAULT_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, 'sample_rate', self.rate)
+        return rate >= 1 or random.random() < rate
+
+
+class RedactQueryTokensFilter(logging.Filter):
+    """Blank out ?jwt= and ?token= values in werkzeug's access log lines."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name == 'werkzeug':
+            message = record.getMessage()
+            redacted = QUERY_SECRET_PATTERN.sub(r'\1[redacted]', message)
+            if redacted != message:
+                record.msg, record.args = redacted, None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including extra= fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != 'sample_rate':
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging():
+    """Route all logging through a queue drained by a background thread.
+
+    Request and worker threads only filter the record and put it on the queue;
+    formatting and writing to stdout happen on the listener thread. Safe to
+    call more than once.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stdout)
+        if os.getenv('LOG_FORMAT', DEFAULT_LOG_FORMAT).lower() == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.SimpleQueue()
+        handler = QueueHandler(log_queue)
+        handler.addFilter(RedactQueryTokensFilter())
+        # Sample before enqueueing so dropped records cost nothing further
+        handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', DEFAULT_SAMPLE_RATE))))
+
+        root = logging.getLogger()
+        root.setLevel(os.getenv('LOG_LEVEL', DEFAULT_LOG_LEVEL).upper())
+        root.addHandler(handler)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # Flush queued records on shutdown
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger; output is set up by configure_logging() in the entry point."""
+    return logging.getLogger(name)
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Question, QuestionSet, QuizResult, ReviewResult } from '../types';
+import { Question, QuestionSet, QuizResult, ReviewResult, StreamedQuestion, UploadProgress } from '../types';
 
 const api = axios.create({
   baseURL: 'http://localhost:5001',
@@ -87,6 +87,105 @@ export const getUploadProgress = async (sessionId: string): Promise<{ status: st
   }
 };
 
+export interface UploadProgressHandlers {
+  onProgress: (progress: Partial<UploadProgress>) => void;
+  onQuestions?: (questions: StreamedQuestion[], chunkIndex: number) => void;
+  onComplete: (result: { message: string; set_id: number | null }) => void;
+  onError: (message: string) => void;
+}
+
+// Give up on an upload that hasn't finished after this long
+const UPLOAD_TIMEOUT_MS = 10 * 60 * 1000;
+// Times in a row a refused stream is reopened with a fresh stream token before giving up
+const MAX_STREAM_RECONNECTS = 3;
+
+// Subscribe to server-sent progress events; returns a function that closes the stream
+export const subscribeUploadProgress = (sessionId: string, handlers: UploadProgressHandlers): (() => void) => {
+  let source: EventSource | null = null;
+  let finished = false;
+  let reconnects = 0;
+  // A new EventSource doesn't send Last-Event-ID, so the resume point is passed explicitly
+  let lastEventId = '';
+  const seenChunks = new Set<number>();
+
+  const finish = () => {
+    finished = true;
+    clearTimeout(timeout);
+    source?.close();
+  };
+  const fail = (message: string) => {
+    finish();
+    handlers.onError(message);
+  };
+  const timeout = setTimeout(() => fail('Upload timed out'), UPLOAD_TIMEOUT_MS);
+
+  const connect = async () => {
+    // EventSource cannot send an Authorization header, so the stream is opened with a
+    // short-lived token scoped to this session instead of the access token
+    let token: string;
+    try {
+      const response = await api.post(`/api/upload-progress/${sessionId}/stream-token`);
+      token = response.data.token;
+    } catch (error) {
+      fail(axios.isAxiosError(error) && error.response?.status === 404
+        ? 'Upload session not found or expired'
+        : 'Could not connect to the server');
+      return;
+    }
+    if (finished) {
+      return;
+    }
+
+    const resume = lastEventId ? `&last_event_id=${encodeURIComponent(lastEventId)}` : '';
+    const stream = new EventSource(
+      `${api.defaults.baseURL}/api/upload-progress/${sessionId}/stream?token=${encodeURIComponent(token)}${resume}`
+    );
+    source = stream;
+
+    stream.addEventListener('open', () => {
+      reconnects = 0;
+    });
+    stream.addEventListener('progress', (event) => {
+      handlers.onProgress(JSON.parse((event as MessageEvent).data));
+    });
+    stream.addEventListener('questions', (event) => {
+      const message = event as MessageEvent;
+      lastEventId = message.lastEventId || lastEventId;
+      const data = JSON.parse(message.data);
+      // Batches can be replayed after a reconnect; report each one once
+      if (seenChunks.has(data.chunk_index)) {
+        return;
+      }
+      seenChunks.add(data.chunk_index);
+      handlers.onQuestions?.(data.questions, data.chunk_index);
+    });
+    stream.addEventListener('complete', (event) => {
+      finish();
+      handlers.onComplete(JSON.parse((event as MessageEvent).data));
+    });
+    ['error', 'cancelled'].forEach((name) => {
+      stream.addEventListener(name, (event) => {
+        const data = (event as MessageEvent).data;
+        if (data !== undefined) {
+          fail(JSON.parse(data).message || 'Upload failed');
+        } else if (stream.readyState === EventSource.CLOSED && !finished) {
+          // The server refused the stream or is unreachable; EventSource only reconnects by
+          // itself after dropped connections. A long stream's token may simply have expired,
+          // so try again with a fresh one; the token request fails for real auth problems.
+          if (reconnects++ < MAX_STREAM_RECONNECTS) {
+            connect();
+          } else {
+            fail('Lost connection to the server while processing the upload');
+          }
+        }
+      });
+    });
+  };
+
+  connect();
+  return finish;
+};
+
 export const deleteSet = async (setId: number): Promise<{ message: string }> => {
   const response = await api.delete(`/api/question-sets/${setId}`);
   return response.data;
@@ -21,7 +21,8 @@ import {
 } from '@chakra-ui/react';
 import { motion } from 'framer-motion';
 import { useQueryClient } from '@tanstack/react-query';
-import { uploadQuestions, getUploadProgress } from '../api';
+import { uploadQuestions, subscribeUploadProgress } from '../api';
+import { StreamedQuestion } from '../types';
 
 const MotionBox = motion(Box);
 const MotionButton = motion(Button);
@@ -32,6 +33,7 @@ export const Generate: React.FC = () => {
   const [numQuestions, setNumQuestions] = useState<number>(10);
   const [isGenerating, setIsGenerating] = useState(false);
   const [generationStatus, setGenerationStatus] = useState('');
+  const [streamedQuestions, setStreamedQuestions] = useState<StreamedQuestion[]>([]);
 
   const toast = useToast();
   const queryClient = useQueryClient();
@@ -68,6 +70,7 @@ export const Generate: React.FC = () => {
 
     setIsGenerating(true);
     setGenerationStatus('Uploading files...');
+    setStreamedQuestions([]);
 
     try {
       const formData = new FormData();
@@ -78,51 +81,43 @@ export const Generate: React.FC = () => {
       const response = await uploadQuestions(formData);
       
       if (response.session_id) {
-        // Start polling for progress
-        let retryCount = 0;
-        const maxRetries = 120; // Maximum 2 minutes of polling
-        
-        const pollInterval = setInterval(async () => {
-          try {
-            if (retryCount >= maxRetries) {
-              clearInterval(pollInterval);
-              throw new Error('Generation timed out');
-            }
-
-            const progress = await getUploadProgress(response.session_id);
-            
-            // Update status
+        // Stream progress updates instead of polling
+        subscribeUploadProgress(response.session_id, {
+          onProgress: (progress) => {
             if (progress.message) {
               setGenerationStatus(progress.message);
             }
-            
-            // Check for completion or error
-            if (progress.status === 'complete') {
-              clearInterval(pollInterval);
-              queryClient.invalidateQueries(['questionSets']);
-              setFiles([]);
-              setSetName('');
-              setNumQuestions(10);
-              toast({
-                title: 'Success!',
-                description: progress.message,
-                status: 'success',
-                duration: 3000,
-                isClosable: true,
-              });
-              setIsGenerating(false);
-              setGenerationStatus('');
-            } else if (progress.status === 'error') {
-              clearInterval(pollInterval);
-              throw new Error(progress.message || 'Failed to generate questions');
-            }
-            
-            retryCount++;
-          } catch (error) {
-            clearInterval(pollInterval);
-            throw error;
-          }
-        }, 1000);
+          },
+          onQuestions: (questions) => {
+            setStreamedQuestions((previous) => [...previous, ...questions]);
+          },
+          onComplete: (result) => {
+            queryClient.invalidateQueries(['questionSets']);
+            setFiles([]);
+            setSetName('');
+            setNumQuestions(10);
+            toast({
+              title: 'Success!',
+              description: result.message,
+              status: 'success',
+              duration: 3000,
+              isClosable: true,
+            });
+            setIsGenerating(false);
+            setGenerationStatus('');
+          },
+          onError: (message) => {
+            toast({
+              title: 'Error',
+              description: message,
+              status: 'error',
+              duration: 3000,
+              isClosable: true,
+            });
+            setIsGenerating(false);
+            setGenerationStatus('');
+          },
+        });
       } else {
         // If no session_id, assume direct completion
         queryClient.invalidateQueries(['questionSets']);
@@ -241,6 +236,17 @@ export const Generate: React.FC = () => {
                   <AlertDescription>{generationStatus}</AlertDescription>
                 </Alert>
               )}
+
+              {streamedQuestions.length > 0 && (
+                <Box w="100%">
+                  <Text mb={2} fontWeight="bold">Questions generated so far ({streamedQuestions.length}):</Text>
+                  <VStack align="start" spacing={1} maxH="240px" overflowY="auto">
+                    {streamedQuestions.map((question, index) => (
+                      <Text key={index} fontSize="sm">{question.question}</Text>
+                    ))}
+                  </VStack>
+                </Box>
+              )}
             </VStack>
           </Box>
         </VStack>
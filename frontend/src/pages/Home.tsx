@@ -33,8 +33,8 @@ import {
 } from '@chakra-ui/react';
 import { DeleteIcon, EditIcon, ChevronDownIcon } from '@chakra-ui/icons';
 import { useQuery, useQueryClient } from '@tanstack/react-query';
-import { Question, QuestionSet } from '../types';
-import { getQuestionSets, startQuiz, deleteSet, updateSetName, uploadQuestions, getUploadProgress } from '../api';
+import { Question, QuestionSet, StreamedQuestion } from '../types';
+import { getQuestionSets, startQuiz, deleteSet, updateSetName, uploadQuestions, subscribeUploadProgress } from '../api';
 import { motion } from 'framer-motion';
 
 const MotionBox = motion(Box);
@@ -49,6 +49,7 @@ export const Home: React.FC<HomeProps> = ({ onStartQuiz }) => {
   const [setName, setSetName] = useState('');
   const [uploadProgress, setUploadProgress] = useState<number | null>(null);
   const [uploadStatus, setUploadStatus] = useState<string>('');
+  const [streamedQuestions, setStreamedQuestions] = useState<StreamedQuestion[]>([]);
   const [selectedSets, setSelectedSets] = useState<number[]>([]);
   const [editingSetId, setEditingSetId] = useState<number | null>(null);
   const [newSetName, setNewSetName] = useState('');
@@ -93,6 +94,7 @@ export const Home: React.FC<HomeProps> = ({ onStartQuiz }) => {
     try {
       setUploadProgress(0);
       setUploadStatus('Starting upload...');
+      setStreamedQuestions([]);
       
       const formData = new FormData();
       formData.append('file', file);
@@ -126,56 +128,45 @@ export const Home: React.FC<HomeProps> = ({ onStartQuiz }) => {
         throw new Error('No session ID received from server');
       }
 
-      let retryCount = 0;
-      const maxRetries = 120; // Maximum 2 minutes of polling
-      
-      // Start polling for progress
-      const pollInterval = setInterval(async () => {
-        try {
-          if (retryCount >= maxRetries) {
-            clearInterval(pollInterval);
-            throw new Error('Upload timed out');
-          }
-
-          const progress = await getUploadProgress(response.session_id!);
-          
-          // Update progress and status
+      // Stream progress updates instead of polling
+      subscribeUploadProgress(response.session_id, {
+        onProgress: (progress) => {
           if (progress.percent !== undefined) {
             setUploadProgress(progress.percent);
           }
           if (progress.message) {
             setUploadStatus(progress.message);
           }
-          
-          // Check for completion or error
-          if (progress.status === 'complete') {
-            clearInterval(pollInterval);
-            toast({
-              title: 'Upload successful',
-              description: progress.message,
-              status: 'success',
-              duration: 3000,
-              isClosable: true,
-            });
-            // Add a small delay before invalidating queries to ensure DB consistency
-            setTimeout(() => {
-              queryClient.invalidateQueries({ queryKey: ['questionSets'] });
-            }, 500);
-            setFile(null);
-            setSetName('');
-            setUploadProgress(null);
-            setUploadStatus('');
-          } else if (progress.status === 'error') {
-            clearInterval(pollInterval);
-            throw new Error(progress.message || 'Upload failed');
-          }
-          
-          retryCount++;
-        } catch (error) {
-          clearInterval(pollInterval);
-          throw error;
-        }
-      }, 1000); // Check every second
+        },
+        onQuestions: (questions) => {
+          setStreamedQuestions((previous) => [...previous, ...questions]);
+        },
+        onComplete: (result) => {
+          toast({
+            title: 'Upload successful',
+            description: result.message,
+            status: 'success',
+            duration: 3000,
+            isClosable: true,
+          });
+          queryClient.invalidateQueries({ queryKey: ['questionSets'] });
+          setFile(null);
+          setSetName('');
+          setUploadProgress(null);
+          setUploadStatus('');
+        },
+        onError: (message) => {
+          setUploadProgress(null);
+          setUploadStatus('');
+          toast({
+            title: 'Upload failed',
+            description: message,
+            status: 'error',
+            duration: 5000,
+            isClosable: true,
+          });
+        },
+      });
     } catch (error) {
       setUploadProgress(null);
       setUploadStatus('');
@@ -510,6 +501,16 @@ export const Home: React.FC<HomeProps> = ({ onStartQuiz }) => {
                     <AlertIcon />
                     <AlertDescription>{uploadStatus || 'Processing...'}</AlertDescription>
                   </Alert>
+                  {streamedQuestions.length > 0 && (
+                    <Box mt={2}>
+                      <Text mb={1} fontWeight="bold">Questions so far ({streamedQuestions.length}):</Text>
+                      <VStack align="start" spacing={1} maxH="200px" overflowY="auto">
+                        {streamedQuestions.map((question, index) => (
+                          <Text key={index} fontSize="sm">{question.question}</Text>
+                        ))}
+                      </VStack>
+                    </Box>
+                  )}
                 </Box>
               )}
             </VStack>
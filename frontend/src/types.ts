@@ -52,3 +52,18 @@ export interface ReviewResult {
   }>;
   has_incorrect: boolean;
 }
+
+export interface UploadProgress {
+  status: string;
+  message: string;
+  percent: number;
+}
+
+// Question as sent in the upload progress stream, before it is saved to a set
+export interface StreamedQuestion {
+  question: string;
+  options: string[];
+  correct_answer: string;
+  source_lecture?: string;
+  page_range?: string;
+}
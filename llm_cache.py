@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict
+
+# Defaults can be overridden through the environment
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), 'llm_cache.db')
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # 30 days in seconds
+EVICTION_INTERVAL = 50  # Run eviction every N writes
+FLUSH_INTERVAL = 30  # Seconds between writes of hit/miss counters and access times
+
+
+class LLMResponseCache:
+    """Persistent, content-addressed cache for LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of everything that determines the response
+    (model, prompt template version, temperature and the chunk text), so the
+    same lecture uploaded twice is answered from disk instead of the API.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age: int = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Lookups only read; counters and access times are batched and flushed periodically
+        self._hits = 0
+        self._misses = 0
+        self._accessed = {}  # Key -> last access time not yet written
+        self._flushed_at = time.time()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_created_at ON responses (created_at)')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )""")
+        self._conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, temperature: float, text: str, *extra) -> str:
+        """Build a content-addressed key for a completion request."""
+        payload = json.dumps([model, prompt_version, temperature, text, *extra], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[1] + self.max_age < now:
+                row = None  # Expired; removed by the next eviction
+
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._accessed[key] = now
+            if now - self._flushed_at >= FLUSH_INTERVAL:
+                self._flush(now)
+
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: str):
+        """Store a response and evict old entries when the cache grows too large."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), now, now)
+            )
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._flush(now)  # So eviction sees recent access times
+                self._evict(now)
+
+    def flush(self):
+        """Write pending hit/miss counters and access times to the database."""
+        with self._lock:
+            self._flush(time.time())
+
+    def _flush(self, now: float):
+        self._flushed_at = now
+        if not (self._hits or self._misses or self._accessed):
+            return
+        self._conn.execute('BEGIN')
+        self._conn.execute("UPDATE counters SET value = value + ? WHERE name = 'hits'", (self._hits,))
+        self._conn.execute("UPDATE counters SET value = value + ? WHERE name = 'misses'", (self._misses,))
+        self._conn.executemany(
+            'UPDATE responses SET accessed_at = ? WHERE key = ?',
+            [(accessed_at, key) for key, accessed_at in self._accessed.items()]
+        )
+        self._conn.execute('COMMIT')
+        self._hits = self._misses = 0
+        self._accessed.clear()
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under the limits."""
+        self._conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.max_age,))
+
+        count, total_bytes = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Walk entries from least to most recently used and delete until within limits
+        to_delete = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            count -= 1
+            total_bytes -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            self._flush(time.time())
+            counters = dict(self._conn.execute('SELECT name, value FROM counters').fetchall())
+            count, total_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'entries': count,
+            'bytes': total_bytes
+        }
+
+    def clear(self):
+        """Remove all cached responses and reset the counters."""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.execute('UPDATE counters SET value = 0')
+            self._hits = self._misses = 0
+            self._accessed.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Return the process-wide response cache, or None if caching is disabled."""
+    global _cache
+    if os.getenv('LLM_CACHE_ENABLED', '1').lower() in ('0', 'false', 'no'):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache(
+                path=os.getenv('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+                max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                max_age=int(os.getenv('LLM_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+            )
+            atexit.register(_cache.flush)
+        return _cache
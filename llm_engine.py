@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import threading
+import concurrent.futures
+from typing import Any, Callable, Coroutine, List, Dict
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from llm_retry import (
+    AdaptiveLimiter, RetryController, DEFAULT_MAX_RETRIES, DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_TIMEOUT
+)
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Defaults can be overridden through the environment
+DEFAULT_MAX_CONCURRENCY = 8  # Requests in flight across every session in this process
+DEFAULT_REQUESTS_PER_MINUTE = 60  # Provider rate limit shared by every session
+DEFAULT_BLOCKING_WORKERS = 4  # Threads for PDF parsing and database writes
+
+
+class TokenBucket:
+    """Async token bucket that caps how many requests may start per second."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        """Wait until a request may start."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Waiters are served one at a time so the bucket refills fairly
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMEngine:
+    """Process-wide asyncio engine for LLM calls.
+
+    All requests run on a single event loop in one background thread using the
+    async OpenAI client. An adaptive concurrency limiter and a token bucket cap
+    throughput for every upload session together, a shared RetryController
+    handles 429s and transient errors, and blocking work (PDF parsing, database
+    writes) is offloaded to a small fixed thread pool.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 blocking_workers: int = DEFAULT_BLOCKING_WORKERS,
+                 retry_controller: RetryController = None):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.blocking_workers = blocking_workers
+        self.retry = retry_controller or RetryController(AdaptiveLimiter(max_concurrency))
+        self.limiter = self.retry.limiter
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._bucket = TokenBucket(requests_per_minute / 60.0, max_concurrency)
+        self._blocking_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=blocking_workers, thread_name_prefix='llm-blocking'
+        )
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(self._blocking_executor)
+                self._thread = threading.Thread(target=self._loop.run_forever, name='llm-engine', daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def _get_client(self) -> AsyncOpenAI:
+        if self._client is None:
+            load_dotenv()
+            self._client = AsyncOpenAI(
+                base_url="https://models.inference.ai.azure.com",
+                api_key=os.getenv('GITHUB_TOKEN'),
+                max_retries=0  # Retries are handled by the shared RetryController
+            )
+        return self._client
+
+    async def complete(self, messages: List[Dict[str, str]], model: str, temperature: float,
+                       max_tokens: int = 4096, top_p: float = 1):
+        """Run a chat completion under the process-wide concurrency and rate limits.
+
+        Transient failures are retried by the shared RetryController; raises
+        LLMUnavailableError when the provider stays unavailable.
+        """
+        attempt = 0
+        while True:
+            trial = await self.retry.before_request()
+            try:
+                async with self.limiter:
+                    await self._bucket.acquire()
+                    try:
+                        response = await self._get_client().chat.completions.create(
+                            messages=messages,
+                            model=model,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            top_p=top_p
+                        )
+                    except Exception as e:
+                        delay = self.retry.record_failure(e, attempt)
+                        error_name = type(e).__name__
+                    else:
+                        self.retry.record_success()
+                        return response
+            finally:
+                # Also runs when the request is cancelled while waiting for the limiter or bucket
+                if trial:
+                    self.retry.release_trial()
+            logger.warning("LLM request failed (%s), retrying in %.1f seconds...", error_name, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        """Run a blocking function on the engine's fixed thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._blocking_executor, func, *args)
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the engine loop without waiting for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro: Coroutine) -> Any:
+        """Run a coroutine on the engine loop and block until it finishes."""
+        loop = self._ensure_started()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("LLMEngine.run() cannot be called from the engine loop; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_llm_engine() -> LLMEngine:
+    """Return the process-wide LLM engine shared by every processor and session."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+            limiter = AdaptiveLimiter(max_concurrency)
+            retry_controller = RetryController(
+                limiter,
+                max_retries=int(os.getenv('LLM_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+                failure_threshold=int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD)),
+                reset_timeout=float(os.getenv('LLM_CIRCUIT_RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT))
+            )
+            _engine = LLMEngine(
+                max_concurrency=max_concurrency,
+                requests_per_minute=int(os.getenv('LLM_REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE)),
+                blocking_workers=int(os.getenv('LLM_BLOCKING_WORKERS', DEFAULT_BLOCKING_WORKERS)),
+                retry_controller=retry_controller
+            )
+        return _engine
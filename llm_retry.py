@@ -0,0 +1,229 @@
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import openai
+
+# Defaults can be overridden through the environment (see llm_engine.get_llm_engine)
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0  # Seconds
+DEFAULT_MAX_DELAY = 60.0  # Seconds
+DEFAULT_FAILURE_THRESHOLD = 8  # Consecutive server or connection errors before the circuit opens
+DEFAULT_RESET_TIMEOUT = 30.0  # Seconds the circuit stays open before a trial request
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the LLM provider cannot serve a request after retries or while the circuit is open."""
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Return the delay in seconds requested by the provider's Retry-After headers, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Async concurrency limiter whose limit shrinks on rate limiting and grows back on success (AIMD)."""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, increase_every: int = 10):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase_every = increase_every
+        self.limit = max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def __aenter__(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def record_success(self):
+        self._successes += 1
+        if self._successes >= self.increase_every and self.limit < self.max_limit:
+            self._successes = 0
+            self.limit += 1
+            if self._condition is not None:
+                # Wake waiters on the next loop iteration; notify requires holding the lock
+                asyncio.ensure_future(self._notify())
+
+    def record_rate_limited(self):
+        self._successes = 0
+        now = time.monotonic()
+        # Halve at most once per second so a burst of 429s from one window counts once
+        if now - self._last_decrease >= 1.0:
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit // 2)
+
+    async def _notify(self):
+        condition = self._get_condition()
+        async with condition:
+            condition.notify_all()
+
+
+class RetryController:
+    """Retry policy shared by every worker in the process.
+
+    Backoff uses full jitter so workers don't retry in lockstep, and rate
+    limiting (429) pauses all workers until the provider is ready again without
+    counting as a failure. Repeated server or connection errors open a circuit
+    breaker; callers then wait for it to close instead of sending more calls,
+    and give up only after ``max_retries`` open periods.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, limiter: AdaptiveLimiter, max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.paused_until = 0.0
+        self._trial_in_flight = False
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def before_request(self) -> bool:
+        """Wait out any provider-requested pause and any open circuit.
+
+        Returns True when the caller was given the half-open trial slot; it must
+        then call release_trial() once the request finishes, however it ends.
+        Other callers wait for the trial's outcome. Raises LLMUnavailableError
+        once the circuit has stayed open for max_retries periods.
+        """
+        wait = self.paused_until - time.monotonic()
+        if wait > 0:
+            # Spread resumption out so workers don't all fire the moment the pause ends
+            await asyncio.sleep(wait + random.uniform(0, min(wait, self.base_delay)))
+
+        open_periods = 0
+        while True:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    if open_periods >= self.max_retries:
+                        raise LLMUnavailableError(
+                            "Question generation service is unavailable; try again in a few minutes"
+                        )
+                    open_periods += 1
+                    await asyncio.sleep(remaining + random.uniform(0, self.base_delay))
+                    continue
+                self.state = self.HALF_OPEN
+            if self.state != self.HALF_OPEN:
+                return False
+            if not self._trial_in_flight:
+                # No await between taking the slot and the caller's try/finally, so it can't leak
+                self._trial_in_flight = True
+                return True
+            condition = self._get_condition()
+            async with condition:
+                await condition.wait_for(lambda: not self._trial_in_flight)
+
+    def release_trial(self):
+        """Free the half-open trial slot and wake the callers waiting on its outcome."""
+        self._trial_in_flight = False
+        if self._condition is not None:
+            # notify requires holding the lock; wake waiters on the next loop iteration
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        condition = self._get_condition()
+        async with condition:
+            condition.notify_all()
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self.limiter.record_success()
+
+    def record_failure(self, error: Exception, attempt: int) -> float:
+        """Record a failed attempt and return how long to wait before retrying.
+
+        Rate limiting only slows every worker down; server and connection errors
+        count toward opening the circuit, which the next before_request() waits
+        out. Raises the original error when it is not retryable, or
+        LLMUnavailableError once retries are exhausted.
+        """
+        if not isinstance(error, RETRYABLE_ERRORS):
+            raise error
+
+        retry_after = None
+        if isinstance(error, openai.RateLimitError):
+            self.limiter.record_rate_limited()
+            retry_after = parse_retry_after(error)
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        else:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and
+                                                self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+        if attempt >= self.max_retries:
+            raise LLMUnavailableError(
+                f"Question generation service failed after {attempt + 1} attempts: {str(error)}"
+            ) from error
+
+        # Full jitter; the shared pause (if any) is applied in before_request
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return backoff if retry_after is None else max(backoff, retry_after)
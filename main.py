@@ -1,9 +1,11 @@
-from api import create_app, db
+from api import create_app
 
-app = create_app()
+# PDF worker processes (spawn/forkserver) re-import this module as __mp_main__;
+# only the real process builds the app and starts its job dispatcher
+if __name__ != '__mp_main__':
+    # Also the WSGI entry point (e.g. gunicorn main:app); the schema is created and
+    # the job dispatcher started inside create_app
+    app = create_app()
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -1,31 +1,77 @@
 import os
-from openai import OpenAI
 import json
 from typing import List, Dict, Union, Callable, Tuple
 import PyPDF2
 import re
-import time
-import concurrent.futures
+import asyncio
 from tqdm import tqdm
 import shutil
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
+from llm_cache import get_llm_cache
+from llm_engine import get_llm_engine
+from llm_retry import LLMUnavailableError
+from pdf_text import PDFDocument
+from text_tokens import count_tokens
+from app_logging import get_logger
+
+# Bump whenever the extraction prompts change so stale cached responses are not reused
+PROMPT_VERSION = 'extractor-v1'
+
+logger = get_logger(__name__)
+
+# Question numbering styles, matched in one pass at the start of a line; each named
+# group captures the number. Numbers inside a line ("see section 3. of ...") never match.
+QUESTION_MARKER_PATTERN = re.compile(
+    r'^[ \t]*(?:'
+    r'Question\s+(?P<question>\d+)[\.-]'  # Question 1. or Question 1-
+    r'|Q(?P<q>\d+)[\.-]'  # Q1. or Q1-
+    r'|\((?P<paren>\d+)\)'  # (1) style
+    r'|\[(?P<bracket>\d+)\]'  # [1] style
+    r'|(?P<number>\d+)[\.-](?!\d)'  # Standard numbered questions (1. or 1-)
+    r')\s+',
+    re.M
+)
+OPTION_PATTERN = re.compile(r'(?:[A-D]\.|\(True/False\)|True\s*False)')
+
+# Batch sizing, overridable through EXTRACTOR_BATCH_TOKENS
+DEFAULT_BATCH_TOKENS = 2500  # Question text sent per request
+MAX_OUTPUT_TOKENS = 4096  # Completion limit requested from the model
+OUTPUT_BUDGET_RATIO = 0.75  # Leave headroom so estimates that run long aren't truncated
+OUTPUT_TOKENS_RATIO = 1.1  # Extracted JSON is about as long as the question text...
+OUTPUT_TOKENS_PER_QUESTION = 30  # ...plus the keys and punctuation around each question
 
 class MCQExtractor:
     def __init__(self):
         load_dotenv()
-        self.client = OpenAI(
-            base_url="https://models.inference.ai.azure.com",
-            api_key=os.getenv('GITHUB_TOKEN')
-        )
+        # LLM calls go through the shared engine so every session respects one global limit
+        self.engine = get_llm_engine()
         self.progress_callback = None
         self.current_progress = 0
         self.total_progress = 0
         self.max_workers = 5  # Number of parallel workers
+        self.model = "gpt-4o"
+        self.temperature = 0.1
+        self.cache = get_llm_cache()
+        self.completed_chunks = {}  # Chunk index -> questions already produced (when resuming a job)
+        self.chunk_callback = None
+        self.batch_tokens = int(os.getenv('EXTRACTOR_BATCH_TOKENS', DEFAULT_BATCH_TOKENS))
+        self.max_output_tokens = MAX_OUTPUT_TOKENS
 
     def set_progress_callback(self, callback):
         self.progress_callback = callback
 
+    def set_checkpoint(self, completed_chunks: Dict[int, List[Dict]], chunk_callback: Callable = None):
+        """Resume from previously finished chunks and report each newly finished one."""
+        self.completed_chunks = completed_chunks or {}
+        self.chunk_callback = chunk_callback
+
+    async def record_chunk(self, index: int, questions: List[Dict]):
+        """Hand a finished chunk to the checkpoint callback, awaiting it if it is a coroutine."""
+        if self.chunk_callback:
+            result = self.chunk_callback(index, questions)
+            if asyncio.iscoroutine(result):
+                await result
+
     def update_progress(self, status: str, current: int, total: int):
         self.current_progress = current
         self.total_progress = total
@@ -34,22 +80,27 @@ class MCQExtractor:
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF file."""
+        return self.extract_text_from_document(PDFDocument(pdf_path))
+
+    def extract_text_from_document(self, document: PDFDocument) -> str:
+        """Extract and clean the text of an already opened PDF document."""
         try:
-            print(f"Processing PDF file: {pdf_path}")
-            text = extract_text(pdf_path)
+            logger.info("Processing PDF file: %s", document.path)
+            text = document.text(separator='\n')
             if not text.strip():
                 raise Exception("No text could be extracted from the PDF file. The PDF might be scanned or have security restrictions.")
             
-            # Clean up common PDF extraction issues
+            # Clean up common PDF extraction issues, keeping line breaks: question
+            # markers are only recognized at the start of a line
             text = re.sub(r'\f', '\n', text)  # Replace form feeds with newlines
-            text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)  # Join lines unless there's a double newline
-            text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
+            text = re.sub(r'[^\S\n]+', ' ', text)  # Normalize whitespace within lines
+            text = re.sub(r' *\n *', '\n', text)  # Trim line ends
             text = re.sub(r'\n{3,}', '\n\n', text)  # Normalize multiple newlines
             text = text.strip()
             
             return text
         except Exception as e:
-            print(f"Error in extract_text_from_pdf: {str(e)}")
+            logger.error("Error in extract_text_from_pdf: %s", e)
             raise Exception(f"Error reading PDF: {str(e)}")
 
     def clean_text(self, text: str) -> str:
@@ -62,49 +113,138 @@ class MCQExtractor:
 
     def chunk_text(self, text: str) -> List[str]:
         """Split text into chunks containing questions."""
-        # More flexible question number patterns
-        question_patterns = [
-            r'\n\s*\d+[\.-]\s+',  # Standard numbered questions (1. or 1-)
-            r'\n\s*Q\d+[\.-]\s+',  # Q1. or Q1-
-            r'\n\s*Question\s+\d+[\.-]\s+',  # Question 1. or Question 1-
-            r'\n\s*\(\d+\)\s+',  # (1) style
-            r'\n\s*\[\d+\]\s+'  # [1] style
-        ]
+        questions = self.split_questions(text)
         
-        # Try each pattern until we find questions
-        questions = []
-        for pattern in question_patterns:
-            questions = [q.strip() for q in re.split(pattern, text) if q.strip()]
-            if len(questions) > 1:  # Found questions with this pattern
-                break
+        if len(questions) <= 1:
+            # If no numbering was found, try to split on double newlines and look for question-like
+            # content; each becomes one line, like split_questions, so batches split between questions
+            paragraphs = [' '.join(q.split()) for q in text.split('\n\n') if q.strip()]
+            paragraphs = [q for q in paragraphs if OPTION_PATTERN.search(q)]
+            questions = paragraphs or questions
         
-        if not questions:
-            # If no patterns worked, try to split on double newlines and look for question-like content
-            questions = [q.strip() for q in text.split('\n\n') if q.strip()]
-            questions = [q for q in questions if re.search(r'(?:[A-D]\.|\(True/False\)|True\s*False)', q)]
+        logger.info("Found %d potential questions", len(questions))
         
-        print(f"\nFound {len(questions)} potential questions")
-        
-        # Group questions into batches of 5 (smaller batches for better processing)
+        # Pack as many questions per request as fit the input budget and the model's output limit
         batches = []
         current_batch = []
+        input_tokens = 0
+        output_tokens = 0
+        output_budget = self.max_output_tokens * OUTPUT_BUDGET_RATIO
         for question in questions:
-            current_batch.append(question)
-            if len(current_batch) == 5:
+            tokens = count_tokens(question, self.model)
+            estimated_output = int(tokens * OUTPUT_TOKENS_RATIO) + OUTPUT_TOKENS_PER_QUESTION
+            if current_batch and (input_tokens + tokens > self.batch_tokens or
+                                  output_tokens + estimated_output > output_budget):
                 batches.append('\n'.join(current_batch))
                 current_batch = []
+                input_tokens = 0
+                output_tokens = 0
+            current_batch.append(question)
+            input_tokens += tokens
+            output_tokens += estimated_output
         
         # Add any remaining questions
         if current_batch:
             batches.append('\n'.join(current_batch))
         
-        print(f"Split text into {len(batches)} batches")
+        logger.info("Split text into %d batches", len(batches))
         return batches
 
-    def process_batch(self, batch: str, batch_index: int, total_batches: int) -> Tuple[int, List[Dict]]:
+    def split_questions(self, text: str) -> List[str]:
+        """Split text into questions at their numbering, in a single scan.
+
+        Every supported numbering style is matched by one combined pattern. For each
+        style, runs of consecutive numbers (1, 2, 3, ...) are taken longest first from
+        the parts of the document not yet covered, so sections that restart their
+        numbering each form a run while stray matches such as numbered options or
+        "page 2." are filtered out. Runs are then accepted longest first across all
+        styles as long as they cover a different part of the document, so
+        mixed-style files split too.
+        """
+        matches = {}  # style -> [(number, start, end)] in document order
+        for match in QUESTION_MARKER_PATTERN.finditer(text):
+            style = match.lastgroup
+            matches.setdefault(style, []).append((int(match.group(style)), match.start(), match.end()))
+
+        runs = []
+        for found in matches.values():
+            while True:
+                run = self.longest_run(found, text)
+                if len(run) < 2:
+                    break
+                runs.append(run)
+                first, last = run[0][1], run[-1][1]
+                found = [m for m in found if m[1] < first or m[1] > last]
+        runs.sort(key=len, reverse=True)
+        markers = []
+        covered = []  # (first start, last start) of each accepted run
+        for run in runs:
+            if len(run) < 2:
+                break
+            first, last = run[0][1], run[-1][1]
+            if any(first <= end and start <= last for start, end in covered):
+                continue
+            covered.append((first, last))
+            markers.extend(run)
+        if not markers:
+            return [text.strip()] if text.strip() else []
+
+        markers.sort(key=lambda m: m[1])
+        questions = [text[:markers[0][1]]]
+        for (_, _, end), (_, next_start, _) in zip(markers, markers[1:] + [(0, len(text), 0)]):
+            questions.append(text[end:next_start])
+        # Only the markers used as split points are removed; each question becomes one line
+        questions = [' '.join(q.split()) for q in questions]
+        return [q for q in questions if q]
+
+    def longest_run(self, found: List[Tuple[int, int, int]], text: str = '') -> List[Tuple[int, int, int]]:
+        """Return the longest subsequence of markers numbered n, n+1, n+2, ... in document order.
+
+        When several markers carry the same number and would end equally long
+        runs, a later one replaces an earlier one only if a question ended in
+        between: options follow the earlier marker, or the numbering restarted
+        (a lower number appears). So a stray "3." in question 2's stem gives way to
+        the real question 3, a "3." inside question 3's stem doesn't replace it,
+        and a section that restarts at 1 is chained on its own instead of
+        continuing an earlier section's run.
+        """
+        best_ending = {}  # number -> (run length, index of the marker ending that run)
+        previous = [None] * len(found)
+        best = None
+        for i, (number, start, _) in enumerate(found):
+            length, prev = best_ending.get(number - 1, (0, None))
+            previous[i] = prev
+            current = best_ending.get(number)
+            if current is None or current[0] < length + 1 or (
+                    current[0] == length + 1 and self.question_ended(found, current[1], i, text)):
+                best_ending[number] = (length + 1, i)
+            if best is None or length + 1 > best[0]:
+                best = (length + 1, i)
+
+        run = []
+        i = best[1] if best else None
+        while i is not None:
+            run.append(found[i])
+            i = previous[i]
+        return run[::-1]
+
+    def question_ended(self, found: List[Tuple[int, int, int]], earlier: int, later: int, text: str) -> bool:
+        """Whether a question ends between markers earlier and later (indexes into found)."""
+        number = found[later][0]
+        return (bool(OPTION_PATTERN.search(text, found[earlier][2], found[later][1])) or
+                any(found[k][0] < number for k in range(earlier + 1, later)))
+
+    def split_batch(self, batch: str) -> List[str]:
+        """Split a batch in two between questions (one per line); returns [] for a single question."""
+        lines = batch.split('\n')
+        if len(lines) < 2:
+            return []
+        middle = len(lines) // 2
+        return ['\n'.join(lines[:middle]), '\n'.join(lines[middle:])]
+
+    async def process_batch(self, batch: str, batch_index: int, total_batches: int) -> Tuple[int, List[Dict]]:
         """Process a single batch of questions."""
-        print(f"\nProcessing batch {batch_index + 1}/{total_batches}:")
-        print(f"Batch content: {batch[:500]}...")
+        logger.debug("Processing batch %d/%d: %.500s...", batch_index + 1, total_batches, batch)
 
         system_prompt = """You are an expert at extracting multiple choice questions from text and formatting them as JSON. For each question:
 1. Remove question numbers
@@ -134,29 +274,55 @@ Questions to process:
 
         max_retries = 3
         retry_count = 0
+
+        cache_key = None
+        cached_response = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model, PROMPT_VERSION, self.temperature, batch)
+            cached_response = await self.engine.run_blocking(self.cache.get, cache_key)
         
         while retry_count < max_retries:
             try:
-                response = self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": system_prompt,
-                        },
-                        {
-                            "role": "user",
-                            "content": user_prompt,
-                        }
-                    ],
-                    model="gpt-4o",
-                    temperature=0.1,
-                    max_tokens=4096,
-                    top_p=1
-                )
-                
-                ai_response = response.choices[0].message.content.strip()
-                print(f"\nAI Response for batch {batch_index + 1}:")
-                print(ai_response[:500])
+                if cached_response is not None:
+                    # Only trust the cached response once; fall back to the API if it fails validation
+                    ai_response = cached_response
+                    cached_response = None
+                    logger.debug("Cache hit for batch %d", batch_index + 1)
+                else:
+                    response = await self.engine.complete(
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": system_prompt,
+                            },
+                            {
+                                "role": "user",
+                                "content": user_prompt,
+                            }
+                        ],
+                        model=self.model,
+                        temperature=self.temperature,
+                        max_tokens=self.max_output_tokens,
+                        top_p=1
+                    )
+                    if response.choices[0].finish_reason == 'length':
+                        # The output limit cut the JSON off; process each half separately instead
+                        halves = self.split_batch(batch)
+                        if not halves:
+                            # One question whose extraction alone exceeds the limit; cutting it up
+                            # would only send fragments, and retrying gives the same result
+                            logger.error("Skipping a question in batch %d whose extraction exceeds the output "
+                                         "limit: %.100s", batch_index + 1, batch)
+                            return batch_index, []
+                        logger.info("Response for batch %d was truncated, splitting it in two", batch_index + 1)
+                        results = await asyncio.gather(*(
+                            self.process_batch(half, batch_index, total_batches) for half in halves
+                        ))
+                        return batch_index, [q for _, questions in results for q in questions]
+                    ai_response = response.choices[0].message.content.strip()
+
+                raw_response = ai_response
+                logger.debug("AI response for batch %d: %.500s", batch_index + 1, ai_response)
                 
                 # Remove markdown and clean response
                 ai_response = re.sub(r'^```json\s*|\s*```$', '', ai_response).strip()
@@ -184,53 +350,69 @@ Questions to process:
                             if q['correct_answer'] in q['options']:
                                 valid_questions.append(q)
                             else:
-                                print(f"\nQuestion skipped - correct_answer not in options:")
-                                print(f"Question: {q['question']}")
-                                print(f"Options: {q['options']}")
-                                print(f"Correct Answer: {q['correct_answer']}")
+                                logger.debug("Question skipped - correct_answer not in options: %r, options %r, "
+                                             "correct answer %r", q['question'], q['options'], q['correct_answer'])
                         else:
-                            print(f"\nInvalid question format:")
-                            print(json.dumps(q, indent=2))
+                            logger.debug("Invalid question format: %r", q)
                 
                 if valid_questions:
-                    print(f"Successfully extracted {len(valid_questions)} questions from batch {batch_index + 1}")
+                    if cache_key:
+                        await self.engine.run_blocking(self.cache.set, cache_key, raw_response)
+                    logger.info("Extracted %d questions from batch %d", len(valid_questions), batch_index + 1)
                     return batch_index, valid_questions
                 
-                print(f"No valid questions found in batch {batch_index + 1}")
+                logger.warning("No valid questions found in batch %d", batch_index + 1)
                 return batch_index, []
                 
+            except LLMUnavailableError:
+                # The engine already retried with backoff; fail the job instead of returning no questions
+                raise
             except Exception as e:
-                print(f"Error processing batch {batch_index + 1}: {str(e)}")
+                logger.warning("Error processing batch %d: %s", batch_index + 1, e)
                 retry_count += 1
                 if retry_count < max_retries:
-                    wait_time = 2 ** retry_count
-                    print(f"Retrying batch {batch_index + 1} in {wait_time} seconds...")
-                    time.sleep(wait_time)
+                    # Malformed responses are retried straight away; pacing is handled by the engine
+                    logger.info("Retrying batch %d...", batch_index + 1)
                 else:
-                    print(f"Failed to process batch {batch_index + 1} after {max_retries} attempts")
+                    logger.error("Failed to process batch %d after %d attempts", batch_index + 1, max_retries)
                     return batch_index, []
         
         return batch_index, []
 
     def extract_mcqs_with_ai(self, text: str) -> Dict[str, List[Dict[str, Union[str, List[str], str]]]]:
         """Use GPT-4 to extract MCQs from text using parallel processing."""
-        print("Starting MCQ extraction...")
-        chunks = self.chunk_text(text)
+        return self.engine.run(self.extract_mcqs_async(text))
+
+    async def extract_mcqs_async(self, text: str) -> Dict[str, List[Dict[str, Union[str, List[str], str]]]]:
+        """Extract MCQs from text, running batches concurrently on the shared LLM engine."""
+        logger.info("Starting MCQ extraction...")
+        # Splitting and token counting (including tiktoken's first download) stay off the event loop
+        chunks = await self.engine.run_blocking(self.chunk_text, text)
         total_batches = len(chunks)
         all_questions = []
         processed_count = 0
 
-        # Create a ThreadPoolExecutor for parallel processing
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all batches to the executor
-            future_to_batch = {
-                executor.submit(self.process_batch, chunk, i, total_batches): i 
-                for i, chunk in enumerate(chunks)
-            }
+        # Batches finished by an earlier, interrupted run of this job are not sent again
+        for i in sorted(self.completed_chunks):
+            all_questions.extend(self.completed_chunks[i])
+            processed_count += 1
+
+        # Bound how many batches this session has in flight; the engine enforces the global limit
+        semaphore = asyncio.Semaphore(self.max_workers)
 
+        async def run_batch(chunk: str, i: int) -> Tuple[int, List[Dict]]:
+            async with semaphore:
+                return await self.process_batch(chunk, i, total_batches)
+
+        tasks = [
+            asyncio.ensure_future(run_batch(chunk, i))
+            for i, chunk in enumerate(chunks) if i not in self.completed_chunks
+        ]
+        try:
             # Process completed batches as they finish
-            for future in concurrent.futures.as_completed(future_to_batch):
-                batch_index, questions = future.result()
+            for next_done in asyncio.as_completed(tasks):
+                batch_index, questions = await next_done
+                await self.record_chunk(batch_index, questions)
                 all_questions.extend(questions)
                 processed_count += 1
                 
@@ -241,18 +423,21 @@ Questions to process:
                     processed_count,
                     total_batches
                 )
+        finally:
+            for task in tasks:
+                task.cancel()
 
         if not all_questions:
-            print("No questions were extracted from any batches")
+            logger.warning("No questions were extracted from any batches")
             raise Exception("No valid questions could be extracted. Please ensure the PDF contains properly formatted multiple choice questions.")
             
-        print(f"Successfully extracted a total of {len(all_questions)} questions")
+        logger.info("Successfully extracted a total of %d questions", len(all_questions))
         return {"questions": all_questions}
 
     def process_file(self, file_path: str) -> Dict[str, List[Dict[str, Union[str, List[str], str]]]]:
         """Process a file and extract/generate questions."""
         try:
-            print("\nStarting file processing...")
+            logger.info("Starting file processing...")
             
             # Extract text from file
             text = self.extract_text_from_pdf(file_path)
@@ -274,27 +459,22 @@ Questions to process:
                     )
                 
                 try:
-                    batch_questions = self.process_batch(chunk, i, total_chunks)
+                    _, batch_questions = self.engine.run(self.process_batch(chunk, i, total_chunks))
                     if batch_questions:
-                        print(f"Successfully extracted {len(batch_questions)} questions from batch {i}")
+                        logger.info("Extracted %d questions from batch %d", len(batch_questions), i)
                         questions.extend(batch_questions)
+                except LLMUnavailableError:
+                    raise
                 except Exception as e:
-                    print(f"Error processing batch {i}: {str(e)}")
+                    logger.warning("Error processing batch %d: %s", i, e)
                     continue
             
             if not questions:
                 raise Exception("No questions could be extracted from the file")
             
-            print(f"Successfully extracted a total of {len(questions)} questions")
+            logger.info("Successfully extracted a total of %d questions", len(questions))
             return {'questions': questions}
             
         except Exception as e:
-            print(f"Error in process_file: {str(e)}")
+            logger.error("Error in process_file: %s", e)
             raise
-
-def extract_text(file_path):
-    pdf_reader = PdfReader(file_path)
-    text = ''
-    for page in pdf_reader.pages:
-        text += page.extract_text()
-    return text
@@ -1,87 +1,208 @@
 import os
-from openai import OpenAI
 import json
-from typing import List, Dict, Union, Callable, Tuple
+from typing import List, Dict, Union, Callable, Tuple, Iterable, Iterator
 import PyPDF2
 import re
-import time
-import concurrent.futures
+import asyncio
 from tqdm import tqdm
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
+from llm_cache import get_llm_cache
+from llm_engine import get_llm_engine
+from llm_retry import LLMUnavailableError
+from pdf_text import PDFDocument, PageIndex
+from text_tokens import CHARS_PER_TOKEN, count_tokens
+from app_logging import get_logger
+
+# Bump whenever the generation prompts change so stale cached responses are not reused
+PROMPT_VERSION = 'generator-v1'
+
+logger = get_logger(__name__)
+
+# Chunk sizing, overridable through GENERATOR_CHUNK_TOKENS / GENERATOR_CHUNK_OVERLAP
+DEFAULT_CHUNK_TOKENS = 1500
+DEFAULT_CHUNK_OVERLAP = 0
+PARAGRAPH_FILL_RATIO = 0.8  # Close a chunk at a paragraph break once it is this full
+
+PARAGRAPH_BREAK_PATTERN = re.compile(r'\f|\n\s*\n')
+PARAGRAPH_PATTERN = re.compile(r'[^\n]+')
+SENTENCE_PATTERN = re.compile(r'\S.*?(?:[.!?]+["\')\]]*(?=\s)|$)')
+WORD_PATTERN = re.compile(r'\S+')
 
 class MCQGenerator:
     def __init__(self):
         load_dotenv()
-        self.client = OpenAI(
-            base_url="https://models.inference.ai.azure.com",
-            api_key=os.getenv('GITHUB_TOKEN')
-        )
+        # LLM calls go through the shared engine so every session respects one global limit
+        self.engine = get_llm_engine()
         self.progress_callback = None
         self.current_progress = 0
         self.total_progress = 0
         self.max_workers = 5  # Number of parallel workers
+        self.model = "gpt-4o"
+        self.temperature = 0.1
+        self.cache = get_llm_cache()
+        self.completed_chunks = {}  # Chunk index -> questions already produced (when resuming a job)
+        self.chunk_callback = None
+        self.chunk_tokens = int(os.getenv('GENERATOR_CHUNK_TOKENS', DEFAULT_CHUNK_TOKENS))
+        self.chunk_overlap = int(os.getenv('GENERATOR_CHUNK_OVERLAP', DEFAULT_CHUNK_OVERLAP))
 
     def set_progress_callback(self, callback):
         self.progress_callback = callback
 
+    def set_checkpoint(self, completed_chunks: Dict[int, List[Dict]], chunk_callback: Callable = None):
+        """Resume from previously finished chunks and report each newly finished one."""
+        self.completed_chunks = completed_chunks or {}
+        self.chunk_callback = chunk_callback
+
+    async def record_chunk(self, index: int, questions: List[Dict]):
+        """Hand a finished chunk to the checkpoint callback, awaiting it if it is a coroutine."""
+        if self.chunk_callback:
+            result = self.chunk_callback(index, questions)
+            if asyncio.iscoroutine(result):
+                await result
+
     def update_progress(self, status: str, current: int, total: int):
         self.current_progress = current
         self.total_progress = total
         if self.progress_callback:
             self.progress_callback(status, current, total)
 
+    def clean_page_text(self, text: str) -> str:
+        """Normalize whitespace in the extracted text of a single page, keeping paragraph breaks."""
+        paragraphs = (re.sub(r'\s+', ' ', p).strip() for p in PARAGRAPH_BREAK_PATTERN.split(text))
+        return '\n\n'.join(p for p in paragraphs if p)
+
+    def iter_page_texts(self, document: PDFDocument) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, cleaned text) for each non-empty page as it is extracted."""
+        for i, text in enumerate(document.iter_pages()):
+            text = self.clean_page_text(text)
+            if text:
+                yield i + 1, text
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text from PDF file."""
         try:
-            print(f"Processing PDF file: {pdf_path}")
-            reader = PdfReader(pdf_path)
-            text_with_pages = []
-            page_numbers = []
-            
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text.strip():
-                    text_with_pages.append(text)
-                    page_numbers.extend([i + 1] * len(text.split()))  # Track page number for each word
-            
-            full_text = " ".join(text_with_pages)
-            
-            # Clean up common PDF extraction issues
-            full_text = re.sub(r'\f', '\n', full_text)
-            full_text = re.sub(r'(?<!\n)\n(?!\n)', ' ', full_text)
-            full_text = re.sub(r'\s+', ' ', full_text)
-            full_text = re.sub(r'\n{3,}', '\n\n', full_text)
-            full_text = full_text.strip()
-            
-            return full_text
+            logger.info("Processing PDF file: %s", pdf_path)
+            return " ".join(text for _, text in self.iter_page_texts(PDFDocument(pdf_path)))
         except Exception as e:
-            print(f"Error in extract_text_from_pdf: {str(e)}")
+            logger.error("Error in extract_text_from_pdf: %s", e)
             raise Exception(f"Error reading PDF: {str(e)}")
 
-    def chunk_text(self, text: str, chunk_size: int = 2000) -> List[str]:
-        """Split text into chunks of approximately equal size."""
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            word_length = len(word) + 1  # +1 for space
-            if current_length + word_length > chunk_size and current_chunk:
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_length = word_length
+    def iter_sentences(self, text: str) -> Iterator[Tuple[str, int, int, bool]]:
+        """Yield (sentence, start, end, starts_paragraph) for a cleaned page text."""
+        for paragraph in PARAGRAPH_PATTERN.finditer(text):
+            first = True
+            for sentence in SENTENCE_PATTERN.finditer(paragraph.group()):
+                yield sentence.group(), paragraph.start() + sentence.start(), paragraph.start() + sentence.end(), first
+                first = False
+
+    def split_long_sentence(self, sentence: str, start: int, tokens: int,
+                            max_tokens: int) -> Iterator[Tuple[str, int, int, int]]:
+        """Split a sentence longer than the budget into word-aligned pieces that fit.
+
+        Pieces that are still too long (e.g. a URL or encoded data without spaces)
+        are cut by characters instead.
+        """
+        words = list(WORD_PATTERN.finditer(sentence))
+        pieces = -(-tokens // max_tokens)
+        per_piece = -(-len(words) // pieces)
+        for i in range(0, len(words), per_piece):
+            first, last = words[i], words[min(i + per_piece, len(words)) - 1]
+            piece = sentence[first.start():last.end()]
+            piece_tokens = count_tokens(piece, self.model)
+            if piece_tokens <= max_tokens:
+                yield piece, start + first.start(), start + last.end(), piece_tokens
             else:
-                current_chunk.append(word)
-                current_length += word_length
-        
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
-        
-        return chunks
+                yield from self.split_by_characters(piece, start + first.start(), piece_tokens, max_tokens)
 
-    def generate_mcqs_from_chunk(self, chunk: str, num_questions: int, lecture_name: str, page_range: str) -> List[Dict]:
+    def split_by_characters(self, text: str, start: int, tokens: int,
+                            max_tokens: int) -> Iterator[Tuple[str, int, int, int]]:
+        """Cut text into consecutive character ranges of at most max_tokens each."""
+        i = 0
+        while i < len(text):
+            end = min(len(text), i + max(1, len(text) * max_tokens // tokens))
+            part_tokens = count_tokens(text[i:end], self.model)
+            while part_tokens > max_tokens and end - i > 1:
+                end = i + max(1, (end - i) * max_tokens // part_tokens)
+                part_tokens = count_tokens(text[i:end], self.model)
+            yield text[i:end], start + i, start + end, part_tokens
+            i = end
+
+    def iter_chunks(self, pages: Iterable[Tuple[int, str]], max_tokens: int = None,
+                    overlap_tokens: int = None) -> Iterator[Tuple[str, int, int]]:
+        """Pack page texts into chunks of up to max_tokens, yielding each as soon as it is full.
+
+        Chunks end on sentence boundaries, and close early at a paragraph break once
+        mostly full. The last overlap_tokens worth of sentences are repeated at the start
+        of the next chunk. Yields (chunk, start, end) where start and end are character
+        offsets in the page texts joined by single spaces, for use with a PageIndex.
+        """
+        max_tokens = max_tokens or self.chunk_tokens
+        overlap_tokens = self.chunk_overlap if overlap_tokens is None else overlap_tokens
+        overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        current = []  # (sentence, start, end, tokens, starts_paragraph)
+        current_tokens = 0
+        carried = 0  # Leading sentences repeated from the previous chunk
+        page_offset = 0
+
+        def build():
+            parts = []
+            for i, (sentence, _, _, _, starts_paragraph) in enumerate(current):
+                if i:
+                    parts.append('\n' if starts_paragraph else ' ')
+                parts.append(sentence)
+            return ''.join(parts), current[0][1], current[-1][2]
+
+        for _, text in pages:
+            for sentence, start, end, starts_paragraph in self.iter_sentences(text):
+                tokens = count_tokens(sentence, self.model)
+                if tokens > max_tokens:
+                    pieces = self.split_long_sentence(sentence, page_offset + start, tokens, max_tokens)
+                else:
+                    pieces = [(sentence, page_offset + start, page_offset + end, tokens)]
+
+                for piece, piece_start, piece_end, piece_tokens in pieces:
+                    # Drop repeated context that would leave no room for new text; only while
+                    # the chunk holds nothing else, otherwise it is closed below with its overlap
+                    while carried and len(current) == carried and current_tokens + piece_tokens > max_tokens:
+                        current_tokens -= current.pop(0)[3]
+                        carried -= 1
+
+                    full = current_tokens + piece_tokens > max_tokens
+                    filled = starts_paragraph and current_tokens >= max_tokens * PARAGRAPH_FILL_RATIO
+                    if len(current) > carried and (full or filled):
+                        yield build()
+                        # Carry trailing sentences into the next chunk as overlap, as far as
+                        # they fit alongside this piece; otherwise the next chunk starts fresh
+                        kept_budget = min(overlap_tokens, max_tokens - piece_tokens)
+                        kept = []
+                        kept_tokens = 0
+                        for item in reversed(current):
+                            if kept_tokens + item[3] > kept_budget:
+                                break
+                            kept.insert(0, item)
+                            kept_tokens += item[3]
+                        current, current_tokens, carried = kept, kept_tokens, len(kept)
+
+                    current.append((piece, piece_start, piece_end, piece_tokens, starts_paragraph))
+                    current_tokens += piece_tokens
+                    starts_paragraph = False
+            page_offset += len(text) + 1
+
+        if len(current) > carried:
+            yield build()
+
+    def chunk_text(self, text: str, max_tokens: int = None, page_index: PageIndex = None) -> List[Tuple[str, str]]:
+        """Split text into chunks of up to max_tokens on sentence and paragraph boundaries.
+
+        Returns (chunk, page_range) pairs; page ranges come from page_index when given.
+        """
+        page_index = page_index or PageIndex()
+        return [
+            (chunk, page_index.page_range(start, end))
+            for chunk, start, end in self.iter_chunks([(1, text)], max_tokens)
+        ]
+
+    async def generate_mcqs_from_chunk(self, chunk: str, num_questions: int, lecture_name: str, page_range: str) -> List[Dict]:
         """Generate MCQs from a text chunk using GPT-4."""
         system_prompt = """You are an expert at generating multiple choice questions from text and formatting them as JSON. For each question:
 1. Create clear, concise questions that test understanding
@@ -114,47 +235,61 @@ Output in this exact JSON format:
 
         max_retries = 3
         retry_count = 0
+
+        # Lecture name and page range are overwritten after parsing, so they are not part of the key
+        cache_key = None
+        cached_response = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model, PROMPT_VERSION, self.temperature, chunk, num_questions)
+            cached_response = await self.engine.run_blocking(self.cache.get, cache_key)
         
         while retry_count < max_retries:
             try:
-                response = self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": system_prompt,
-                        },
-                        {
-                            "role": "user",
-                            "content": user_prompt,
-                        }
-                    ],
-                    model="gpt-4o",
-                    temperature=0.1,
-                    max_tokens=4096,
-                    top_p=1
-                )
-                
-                result = response.choices[0].message.content.strip()
-                print(f"\nAPI Response:\n{result}\n")  # Debug print
+                if cached_response is not None:
+                    # Only trust the cached response once; fall back to the API if it fails validation
+                    result = cached_response
+                    cached_response = None
+                    logger.debug("Cache hit for chunk")
+                else:
+                    response = await self.engine.complete(
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": system_prompt,
+                            },
+                            {
+                                "role": "user",
+                                "content": user_prompt,
+                            }
+                        ],
+                        model=self.model,
+                        temperature=self.temperature,
+                        max_tokens=4096,
+                        top_p=1
+                    )
+                    result = response.choices[0].message.content.strip()
+                    logger.debug("API response: %.500s", result)
+
+                raw_result = result
                 
                 # Remove markdown and clean response
                 result = re.sub(r'^```json\s*|\s*```$', '', result).strip()
                 
                 if not (result.startswith('{') and result.endswith('}')):
-                    print("Response is not a JSON object")
+                    logger.warning("Response is not a JSON object")
                     retry_count += 1
                     continue
                     
                 try:
                     parsed = json.loads(result)
                     if "questions" not in parsed:
-                        print("No 'questions' key in parsed JSON")
+                        logger.warning("No 'questions' key in parsed JSON")
                         retry_count += 1
                         continue
                         
                     questions = parsed["questions"]
                     if not questions:
-                        print("Empty questions list")
+                        logger.warning("Empty questions list")
                         retry_count += 1
                         continue
                         
@@ -163,10 +298,10 @@ Output in this exact JSON format:
                     for q in questions:
                         try:
                             if not all(key in q for key in ["question", "options", "correct_answer"]):
-                                print(f"Missing required keys in question: {q}")
+                                logger.debug("Missing required keys in question: %r", q)
                                 continue
                             if q["correct_answer"] not in q["options"]:
-                                print(f"Correct answer not in options: {q}")
+                                logger.debug("Correct answer not in options: %r", q)
                                 continue
                                 
                             # Add source and page info if missing
@@ -174,85 +309,187 @@ Output in this exact JSON format:
                             q["page_range"] = page_range
                             valid_questions.append(q)
                         except Exception as e:
-                            print(f"Error validating question: {str(e)}")
+                            logger.debug("Error validating question: %s", e)
                             continue
                             
                     if valid_questions:
+                        if cache_key:
+                            await self.engine.run_blocking(self.cache.set, cache_key, raw_result)
                         return valid_questions
                     else:
-                        print("No valid questions found in response")
+                        logger.warning("No valid questions found in response")
                         retry_count += 1
                         continue
                     
                 except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {str(e)}")
-                    print(f"Raw response: {result}")
+                    logger.warning("JSON decode error: %s", e)
+                    logger.debug("Raw response: %.500s", result)
                     retry_count += 1
                     continue
                     
+            except LLMUnavailableError:
+                # The engine already retried with backoff; fail the job instead of returning no questions
+                raise
             except Exception as e:
-                print(f"API error: {str(e)}")
+                logger.warning("API error: %s", e)
                 retry_count += 1
-                time.sleep(1)  # Add a small delay between retries
                 continue
         
-        print(f"Failed to generate valid questions after {max_retries} attempts")
+        logger.error("Failed to generate valid questions after %d attempts", max_retries)
         return []  # Return empty list instead of raising exception
 
+    async def generate_chunks_parallel(self, chunk_jobs: Iterable[Tuple[int, str, int, str]], lecture_name: str,
+                                       total_questions_needed: int,
+                                       estimate_total: Callable[[], int] = None) -> Dict[int, List[Dict]]:
+        """Generate questions for chunks concurrently, stopping once enough questions exist.
+
+        ``chunk_jobs`` may be a lazy iterator (e.g. chunks streamed out of a PDF that
+        is still being parsed); it is advanced off the event loop only when a worker
+        slot frees up. At most ``max_workers`` chunks are in flight at a time.
+        Returns a dict mapping chunk index to the questions generated from that chunk.
+        """
+        if estimate_total is None:
+            total = len(chunk_jobs)
+            estimate_total = lambda: total
+        chunk_results = {}
+        collected = 0
+        completed = 0
+        in_flight = {}
+
+        # Chunks finished by an earlier, interrupted run of this job are not sent again
+        for i, questions in self.completed_chunks.items():
+            chunk_results[i] = questions
+            collected += len(questions)
+            completed += 1
+        if collected >= total_questions_needed:
+            return chunk_results
+        jobs = iter(chunk_jobs)
+
+        async def submit_next():
+            while True:
+                job = await self.engine.run_blocking(next, jobs, None)
+                if job is None:
+                    return False
+                if job[0] not in self.completed_chunks:
+                    break
+            i, chunk, num_questions, page_range = job
+            task = asyncio.ensure_future(self.generate_mcqs_from_chunk(chunk, num_questions, lecture_name, page_range))
+            in_flight[task] = i
+            return True
+
+        try:
+            # Fill the window, then submit one new chunk per completed one
+            for _ in range(self.max_workers):
+                if not await submit_next():
+                    break
+
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i = in_flight.pop(task)
+                    try:
+                        questions = task.result()
+                    except LLMUnavailableError:
+                        raise
+                    except Exception as e:
+                        logger.warning("Error processing chunk %d: %s", i + 1, e)
+                        questions = []
+                    else:
+                        await self.record_chunk(i, questions)
+                    chunk_results[i] = questions
+                    collected += len(questions)
+                    completed += 1
+                    total_chunks = max(completed, estimate_total())
+                    self.update_progress(f"Generating questions from {lecture_name}", completed, total_chunks)
+
+                if collected >= total_questions_needed:
+                    self.update_progress(f"Generating questions from {lecture_name}", completed, completed)
+                    break
+
+                while len(in_flight) < self.max_workers and await submit_next():
+                    pass
+        finally:
+            # Enough questions (or an error); cancel requests that are still in flight
+            for task in in_flight:
+                task.cancel()
+            if hasattr(jobs, 'close'):
+                try:
+                    # Stop parsing the rest of the PDF
+                    await self.engine.run_blocking(jobs.close)
+                except ValueError:
+                    pass  # Still being advanced by a cancelled pull; it is dropped with the job
+
+        return chunk_results
+
     def process_lecture(self, file_path: str, questions_per_chunk: int = 2) -> List[Dict]:
         """Process a single lecture file and generate questions."""
+        return self.engine.run(self.process_lecture_async(file_path, questions_per_chunk))
+
+    async def process_lecture_async(self, file_path: str, questions_per_chunk: int = 2) -> List[Dict]:
+        """Process a lecture file on the shared LLM engine."""
+        return await self.process_document_async(PDFDocument(file_path), questions_per_chunk)
+
+    async def process_document_async(self, document: PDFDocument, questions_per_chunk: int = 2) -> List[Dict]:
+        """Process an already opened lecture document on the shared LLM engine.
+
+        Pages are parsed, cleaned and chunked lazily, so the first chunk is sent
+        to the model while the rest of the PDF is still being parsed.
+        """
         try:
-            lecture_name = os.path.basename(file_path)
-            text = self.extract_text_from_pdf(file_path)
-            chunks = self.chunk_text(text)
-            
-            # Calculate how many chunks we need to process to get the desired number of questions
+            lecture_name = document.name
             total_questions_needed = questions_per_chunk
-            questions_per_chunk_adjusted = max(1, total_questions_needed // len(chunks))
-            remaining_questions = total_questions_needed % len(chunks)
+            # Approximate characters of new text per chunk, for estimating the chunk count
+            chunk_chars = max(1, self.chunk_tokens - min(self.chunk_overlap, self.chunk_tokens // 2)) * CHARS_PER_TOKEN
+            page_count = await self.engine.run_blocking(lambda: document.page_count)
+            seen = {'chars': 0, 'pages': 0, 'chunks': 0}
+            page_index = PageIndex()
+
+            def pages():
+                for page_number, text in self.iter_page_texts(document):
+                    page_index.add_page(page_number, seen['chars'])
+                    seen['chars'] += len(text) + 1
+                    seen['pages'] = page_number
+                    yield page_number, text
+
+            def estimate_total() -> int:
+                # Extrapolate from the pages parsed so far; exact once the whole PDF is read
+                if not seen['pages']:
+                    return max(1, seen['chunks'])
+                estimate = -(-seen['chars'] * page_count // (seen['pages'] * chunk_chars))
+                return max(seen['chunks'], estimate)
+
+            def chunk_jobs():
+                assigned = 0
+                for i, (chunk, start, end) in enumerate(self.iter_chunks(pages())):
+                    seen['chunks'] = i + 1
+                    # Spread the remaining questions over the chunks still expected; depends only
+                    # on the text so far, so a resumed job asks for the same number per chunk
+                    remaining_chunks = max(1, estimate_total() - i)
+                    remaining_questions = max(0, total_questions_needed - assigned)
+                    current_chunk_questions = max(1, -(-remaining_questions // remaining_chunks))
+                    assigned += current_chunk_questions
+
+                    yield i, chunk, current_chunk_questions, page_index.page_range(start, end)
+
+            chunk_results = await self.generate_chunks_parallel(
+                chunk_jobs(), lecture_name, total_questions_needed, estimate_total
+            )
             
+            # Assemble results in chunk order regardless of completion order
             all_questions = []
-            total_chunks = len(chunks)
-            
-            for i, chunk in enumerate(chunks):
-                if len(all_questions) >= total_questions_needed:
-                    break
-                    
-                # Add an extra question to some chunks if we need to distribute remaining questions
-                current_chunk_questions = questions_per_chunk_adjusted
-                if remaining_questions > 0:
-                    current_chunk_questions += 1
-                    remaining_questions -= 1
-                
-                # Determine page range for this chunk
-                chunk_words = chunk.split()
-                start_page = 1
-                end_page = 1
-                page_range = f"{start_page}-{end_page}" if start_page != end_page else str(start_page)
-                
-                self.update_progress(f"Generating questions from {lecture_name}", i + 1, total_chunks)
-                
-                try:
-                    questions = self.generate_mcqs_from_chunk(
-                        chunk,
-                        current_chunk_questions,
-                        lecture_name,
-                        page_range
-                    )
-                    if questions:  # Only extend if we got valid questions
-                        all_questions.extend(questions)
-                except Exception as e:
-                    print(f"Error processing chunk {i + 1}: {str(e)}")
-                    # Continue with next chunk instead of failing completely
-                    continue
+            for i in sorted(chunk_results):
+                all_questions.extend(chunk_results[i])
+            all_questions = all_questions[:total_questions_needed]
             
             if not all_questions:
+                if not seen['chars']:
+                    raise Exception("No text could be extracted from the PDF file")
                 raise Exception("No questions were generated from any chunks")
                 
             return all_questions
             
         except Exception as e:
-            print(f"Error processing lecture {file_path}: {str(e)}")
+            logger.error("Error processing lecture %s: %s", document.path, e)
             raise  # Re-raise the exception to be handled by the caller
 
     def generate_mcqs(self, file_paths: List[str], total_questions: int) -> List[Dict]:
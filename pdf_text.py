@@ -0,0 +1,196 @@
+import os
+import bisect
+import itertools
+import threading
+import collections
+import multiprocessing
+import concurrent.futures
+from array import array
+from typing import Iterator, List, Tuple
+from PyPDF2 import PdfReader
+
+# Defaults can be overridden through the environment
+DEFAULT_BACKEND = 'pypdf2'  # 'pypdf2' or 'pdfplumber'
+DEFAULT_WORKERS = os.cpu_count() or 1
+MIN_PAGES_PER_TASK = 8  # Pages per pool task; smaller documents are parsed in-process
+TASKS_PER_WORKER = 2  # Ranges extracted ahead of the consumer, per worker
+BACKENDS = ('pypdf2', 'pdfplumber')
+
+
+class PageIndex:
+    """Maps character offsets in a document's text back to page numbers.
+
+    Stores one start offset per page in a compact array and looks offsets up
+    with bisect, so a chunk's page range costs O(log pages) and no per-word
+    bookkeeping is kept.
+    """
+
+    def __init__(self):
+        self.offsets = array('I')  # Start offset of each page, ascending
+        self.pages = array('I')  # Page number starting at the matching offset
+
+    def add_page(self, page_number: int, offset: int):
+        """Record that the text of page_number starts at offset."""
+        self.offsets.append(offset)
+        self.pages.append(page_number)
+
+    def page_at(self, offset: int) -> int:
+        """Return the page containing the character at offset."""
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        return self.pages[max(i, 0)] if self.pages else 1
+
+    def page_range(self, start: int, end: int) -> str:
+        """Return the page range covering characters [start, end) as "3" or "3-5"."""
+        start_page = self.page_at(start)
+        end_page = self.page_at(max(start, end - 1))
+        return f"{start_page}-{end_page}" if start_page != end_page else str(start_page)
+
+
+def get_backend(backend: str = None) -> str:
+    """Return the extraction backend to use, validated against the supported ones."""
+    backend = (backend or os.getenv('PDF_BACKEND', DEFAULT_BACKEND)).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{backend}'; expected one of: {', '.join(BACKENDS)}")
+    return backend
+
+
+def count_pages(pdf_path: str, backend: str = None) -> int:
+    """Return the number of pages in a PDF."""
+    if get_backend(backend) == 'pdfplumber':
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_page_range(pdf_path: str, backend: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) in a single process.
+
+    Runs inside pool workers, so it opens the file itself rather than receiving a reader.
+    """
+    if backend == 'pdfplumber':
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            return [pdf.pages[i].extract_text() or '' for i in range(start, end)]
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or '' for i in range(start, end)]
+
+
+def split_pages(page_count: int) -> List[Tuple[int, int]]:
+    """Split page indices into contiguous ranges of MIN_PAGES_PER_TASK pages."""
+    return [(start, min(start + MIN_PAGES_PER_TASK, page_count))
+            for start in range(0, max(0, page_count), MIN_PAGES_PER_TASK)]
+
+
+def get_pdf_workers() -> int:
+    """Return how many processes extract pages in parallel."""
+    return max(1, int(os.getenv('PDF_WORKERS', DEFAULT_WORKERS)))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Return the process-wide pool used for page-parallel extraction."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Never fork the app process itself: its threads (LLM engine, job dispatcher,
+            # logging listener) may hold locks that a forked child would inherit locked.
+            # forkserver workers are forked from a clean server that has only imported this
+            # module; spawn is the fallback where forkserver isn't available.
+            methods = multiprocessing.get_all_start_methods()
+            default = 'forkserver' if 'forkserver' in methods else 'spawn'
+            context = multiprocessing.get_context(os.getenv('PDF_START_METHOD', default))
+            if context.get_start_method() == 'forkserver':
+                context.set_forkserver_preload([__name__])
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=get_pdf_workers(),
+                mp_context=context
+            )
+        return _pool
+
+
+def iter_pages(pdf_path: str, backend: str = None, page_count: int = None) -> Iterator[str]:
+    """Yield the text of each page in order.
+
+    Page ranges are extracted in parallel on the process pool; pages are
+    yielded as soon as every earlier range has finished. At most
+    TASKS_PER_WORKER ranges per worker (of MIN_PAGES_PER_TASK pages each) are
+    in flight, so a slow consumer doesn't make the whole document buffer up.
+    """
+    backend = get_backend(backend)
+    if page_count is None:
+        page_count = count_pages(pdf_path, backend)
+    if page_count <= MIN_PAGES_PER_TASK or get_pdf_workers() == 1:
+        yield from extract_page_range(pdf_path, backend, 0, page_count)
+        return
+
+    pool = get_pdf_pool()
+    ranges = iter(split_pages(page_count))
+    futures = collections.deque(
+        pool.submit(extract_page_range, pdf_path, backend, start, end)
+        for start, end in itertools.islice(ranges, TASKS_PER_WORKER * get_pdf_workers())
+    )
+    try:
+        while futures:
+            pages = futures.popleft().result()
+            next_range = next(ranges, None)
+            if next_range is not None:
+                futures.append(pool.submit(extract_page_range, pdf_path, backend, *next_range))
+            yield from pages
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def extract_pages(pdf_path: str, backend: str = None) -> List[str]:
+    """Return the text of every page in the PDF."""
+    return list(iter_pages(pdf_path, backend))
+
+
+def extract_text(pdf_path: str, backend: str = None, separator: str = '') -> str:
+    """Return the text of the whole PDF, joining the pages once."""
+    return separator.join(iter_pages(pdf_path, backend))
+
+
+class PDFDocument:
+    """An uploaded PDF, parsed at most once and shared by every processing stage.
+
+    Pages are streamed from the process pool on first use; once the whole text
+    has been needed it is kept, so later stages don't parse the file again.
+    """
+
+    def __init__(self, path: str, backend: str = None):
+        self.path = path
+        self.backend = get_backend(backend)
+        self._page_count = None
+        self._pages = None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def page_count(self) -> int:
+        if self._page_count is None:
+            self._page_count = count_pages(self.path, self.backend)
+        return self._page_count
+
+    @property
+    def pages(self) -> List[str]:
+        """Text of every page, parsing the PDF if it hasn't been yet."""
+        if self._pages is None:
+            self._pages = list(iter_pages(self.path, self.backend, self.page_count))
+        return self._pages
+
+    def iter_pages(self) -> Iterator[str]:
+        """Yield page texts, streaming them from the PDF unless they are already loaded."""
+        if self._pages is not None:
+            return iter(self._pages)
+        return iter_pages(self.path, self.backend, self.page_count)
+
+    def text(self, separator: str = '') -> str:
+        """Return the whole text of the document, joining the pages once."""
+        return separator.join(self.pages)
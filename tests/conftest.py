@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules live at the repository root; keep the response cache out of tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['LLM_CACHE_ENABLED'] = '0'
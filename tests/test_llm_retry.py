@@ -0,0 +1,125 @@
+import time
+import asyncio
+from types import SimpleNamespace
+import openai
+import pytest
+from llm_retry import RetryController, AdaptiveLimiter, LLMUnavailableError
+
+
+def status_error(error_class, status_code: int, headers: dict = None):
+    response = SimpleNamespace(request=None, status_code=status_code, headers=headers or {})
+    return error_class('error', response=response, body=None)
+
+
+def rate_limited(retry_after: str = '1'):
+    return status_error(openai.RateLimitError, 429, {'retry-after': retry_after})
+
+
+def server_error():
+    return status_error(openai.InternalServerError, 500)
+
+
+def controller(**kwargs) -> RetryController:
+    kwargs.setdefault('base_delay', 0.01)
+    return RetryController(AdaptiveLimiter(8), **kwargs)
+
+
+def test_rate_limits_pause_without_opening_the_circuit():
+    retry = controller(failure_threshold=3)
+    for _ in range(10):
+        delay = retry.record_failure(rate_limited('2'), attempt=0)
+        assert delay >= 2
+    assert retry.state == RetryController.CLOSED
+    assert retry.consecutive_failures == 0
+    assert retry.paused_until > time.monotonic() + 1
+    assert retry.limiter.limit < 8
+
+
+def test_server_errors_open_the_circuit_at_the_threshold():
+    retry = controller(failure_threshold=3)
+    for _ in range(2):
+        retry.record_failure(server_error(), attempt=0)
+    assert retry.state == RetryController.CLOSED
+    retry.record_failure(server_error(), attempt=0)
+    assert retry.state == RetryController.OPEN
+
+
+def test_success_resets_the_failure_count():
+    retry = controller(failure_threshold=3)
+    retry.record_failure(server_error(), attempt=0)
+    retry.record_failure(server_error(), attempt=0)
+    retry.record_success()
+    retry.record_failure(server_error(), attempt=0)
+    assert retry.state == RetryController.CLOSED
+
+
+def test_non_retryable_errors_are_raised_as_is():
+    retry = controller()
+    with pytest.raises(ValueError):
+        retry.record_failure(ValueError('bad request'), attempt=0)
+
+
+def test_exhausted_retries_raise_unavailable():
+    retry = controller(max_retries=2)
+    with pytest.raises(LLMUnavailableError):
+        retry.record_failure(server_error(), attempt=2)
+
+
+def test_callers_wait_for_the_half_open_trial():
+    async def scenario():
+        retry = controller(failure_threshold=1, reset_timeout=0.05)
+        retry.record_failure(server_error(), attempt=0)
+        assert retry.state == RetryController.OPEN
+
+        # The first caller waits out the open period and gets the trial slot
+        assert await retry.before_request() is True
+        assert retry.state == RetryController.HALF_OPEN
+
+        # A second caller waits for the trial's outcome instead of failing
+        waiter = asyncio.ensure_future(retry.before_request())
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+
+        retry.record_success()
+        retry.release_trial()
+        assert await asyncio.wait_for(waiter, 1) is False
+        assert retry.state == RetryController.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_failed_trial_reopens_the_circuit():
+    async def scenario():
+        retry = controller(failure_threshold=1, reset_timeout=0.05)
+        retry.record_failure(server_error(), attempt=0)
+        assert await retry.before_request() is True
+        retry.record_failure(server_error(), attempt=0)
+        retry.release_trial()
+        assert retry.state == RetryController.OPEN
+
+    asyncio.run(scenario())
+
+
+def test_rate_limited_trial_leaves_the_slot_to_the_next_caller():
+    async def scenario():
+        retry = controller(failure_threshold=1, reset_timeout=0.05)
+        retry.record_failure(server_error(), attempt=0)
+        assert await retry.before_request() is True
+        retry.record_failure(rate_limited('0'), attempt=0)
+        retry.release_trial()
+        assert retry.state == RetryController.HALF_OPEN
+        assert await asyncio.wait_for(retry.before_request(), 1) is True
+
+    asyncio.run(scenario())
+
+
+def test_callers_give_up_after_max_retries_open_periods():
+    async def scenario():
+        retry = controller(failure_threshold=1, reset_timeout=60, max_retries=0)
+        with pytest.raises(LLMUnavailableError):
+            retry.record_failure(server_error(), attempt=0)
+        assert retry.state == RetryController.OPEN
+        with pytest.raises(LLMUnavailableError):
+            await retry.before_request()
+
+    asyncio.run(scenario())
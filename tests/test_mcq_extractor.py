@@ -0,0 +1,116 @@
+import json
+import asyncio
+from types import SimpleNamespace
+import pytest
+from mcq_extractor import MCQExtractor
+from text_tokens import count_tokens
+
+
+@pytest.fixture
+def extractor():
+    return MCQExtractor()
+
+
+def question(label, stem):
+    return f"{label} {stem}\nA. first\nB. second\nC. third\nD. fourth\n"
+
+
+def test_splits_numbered_questions(extractor):
+    text = ''.join(question(f'{i}.', f'What is item {i}?') for i in range(1, 11))
+    questions = extractor.split_questions(text)
+    assert len(questions) == 10
+    assert questions[0] == 'What is item 1? A. first B. second C. third D. fourth'
+
+
+def test_sections_that_restart_numbering_are_all_split(extractor):
+    text = ''.join(
+        f"Section {section}\n" + ''.join(question(f'{i}.', f'Section {section} item {i}?') for i in range(1, 31))
+        for section in range(1, 4)
+    )
+    questions = [q for q in extractor.split_questions(text) if '?' in q]
+    assert len(questions) == 90
+    assert all(q.count('A. first') == 1 for q in questions)
+
+
+def test_sections_of_different_lengths_keep_their_own_runs(extractor):
+    text = (''.join(question(f'{i}.', f'Early item {i}?') for i in range(1, 21)) +
+            ''.join(question(f'{i}.', f'Late item {i}?') for i in range(1, 31)))
+    questions = extractor.split_questions(text)
+    assert len(questions) == 50
+    assert questions[20].startswith('Late item 1?')
+
+
+def test_numbering_inside_a_line_is_not_a_question(extractor):
+    text = question('1.', 'See section 3. of the notes; which is right?') + question('2.', 'Which is larger?')
+    questions = extractor.split_questions(text)
+    assert len(questions) == 2
+    assert 'section 3. of the notes' in questions[0]
+
+
+@pytest.mark.parametrize('stray_in', [2, 3])
+def test_stray_numbered_line_in_a_stem_is_kept(extractor, stray_in):
+    parts = []
+    for i in range(1, 6):
+        stem = f'What is item {i}?'
+        if i == stray_in:
+            stem += '\n3. a numbered line quoted in the question'
+        parts.append(question(f'{i}.', stem))
+    questions = extractor.split_questions(''.join(parts))
+    assert len(questions) == 5
+    assert '3. a numbered line' in questions[stray_in - 1]
+
+
+def test_mixed_numbering_styles(extractor):
+    text = (''.join(question(f'Q{i}.', f'First part {i}?') for i in range(1, 6)) +
+            ''.join(question(f'({i})', f'Second part {i}?') for i in range(1, 6)))
+    assert len(extractor.split_questions(text)) == 10
+
+
+def test_batches_respect_the_token_budget(extractor):
+    extractor.batch_tokens = 200
+    text = ''.join(question(f'{i}.', f'What does item {i} of the course cover in detail?') for i in range(1, 41))
+    batches = extractor.chunk_text(text)
+    assert len(batches) > 1
+    assert all(count_tokens(batch) <= extractor.batch_tokens for batch in batches)
+    lines = [line for batch in batches for line in batch.split('\n')]
+    assert lines == extractor.split_questions(text)
+
+
+class FakeEngine:
+    """Answers extraction prompts, truncating any response for more than max_questions questions."""
+
+    def __init__(self, max_questions: int, too_long: str = None):
+        self.max_questions = max_questions
+        self.too_long = too_long
+        self.calls = 0
+
+    async def complete(self, messages, **kwargs):
+        self.calls += 1
+        lines = messages[-1]['content'].split('Questions to process:\n', 1)[1].split('\n')
+        truncated = len(lines) > self.max_questions or (self.too_long and self.too_long in lines[0])
+        content = json.dumps({'questions': [
+            {'question': line, 'options': ['first', 'second', 'third', 'fourth'], 'correct_answer': 'first'} for line in lines
+        ]})
+        choice = SimpleNamespace(finish_reason='length' if truncated else 'stop',
+                                 message=SimpleNamespace(content=content))
+        return SimpleNamespace(choices=[choice])
+
+    async def run_blocking(self, func, *args):
+        return func(*args)
+
+
+def test_truncated_batches_are_split_between_questions(extractor):
+    extractor.engine = FakeEngine(max_questions=2)
+    batch = '\n'.join(f'Question {i}? A. first B. second' for i in range(8))
+    index, questions = asyncio.run(extractor.process_batch(batch, 3, 5))
+    assert index == 3
+    assert [q['question'] for q in questions] == batch.split('\n')
+
+
+def test_single_question_over_the_output_limit_is_skipped(extractor):
+    extractor.engine = FakeEngine(max_questions=1, too_long='Huge')
+    batch = '\n'.join(['Small one? A. first B. second', 'Huge one? A. first B. second'])
+    _, questions = asyncio.run(extractor.process_batch(batch, 0, 1))
+    assert [q['question'] for q in questions] == ['Small one? A. first B. second']
+    # The whole batch, then each question once; the oversized one isn't cut up or retried
+    assert extractor.engine.calls == 3
@@ -0,0 +1,54 @@
+import pytest
+from mcq_generator import MCQGenerator
+from text_tokens import count_tokens
+
+SENTENCES = [f"Sentence {i} explains how topic number {i} relates to the lecture material." for i in range(60)]
+TEXT = ' '.join(SENTENCES)
+MAX_TOKENS = 100
+
+
+@pytest.fixture
+def generator():
+    return MCQGenerator()
+
+
+def chunk(generator, text, overlap_tokens, max_tokens=MAX_TOKENS):
+    return list(generator.iter_chunks([(1, text)], max_tokens, overlap_tokens))
+
+
+@pytest.mark.parametrize('overlap_tokens', [30, 50])
+def test_consecutive_chunks_share_boundary_sentences(generator, overlap_tokens):
+    chunks = chunk(generator, TEXT, overlap_tokens)
+    assert len(chunks) > 2
+    for (previous, _, previous_end), (text, start, _) in zip(chunks, chunks[1:]):
+        assert start < previous_end
+        shared = TEXT[start:previous_end]
+        assert shared.endswith('.')
+        assert previous.endswith(shared)
+        assert text.startswith(shared)
+
+
+def test_chunks_without_overlap_are_disjoint(generator):
+    chunks = chunk(generator, TEXT, 0)
+    for (_, _, previous_end), (_, start, _) in zip(chunks, chunks[1:]):
+        assert start >= previous_end
+    assert ' '.join(text for text, _, _ in chunks) == TEXT
+
+
+def test_overlap_changes_chunking(generator):
+    assert chunk(generator, TEXT, 0) != chunk(generator, TEXT, 50)
+
+
+@pytest.mark.parametrize('overlap_tokens', [0, 30, 50])
+def test_chunks_stay_within_budget(generator, overlap_tokens):
+    for text, _, _ in chunk(generator, TEXT, overlap_tokens):
+        # Sentences are budgeted separately; joining them may add a token or two
+        assert count_tokens(text) <= MAX_TOKENS * 1.05
+
+
+def test_unsplittable_text_is_cut_to_budget(generator):
+    text = 'x' * 20000
+    chunks = chunk(generator, text, 0, max_tokens=300)
+    assert len(chunks) > 1
+    assert all(count_tokens(part) <= 300 for part, _, _ in chunks)
+    assert ''.join(part for part, _, _ in chunks) == text
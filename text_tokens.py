@@ -0,0 +1,37 @@
+import threading
+from functools import lru_cache
+from app_logging import get_logger
+
+# Rough size of a token for English text, used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+DEFAULT_ENCODING = 'o200k_base'  # Encoding used by gpt-4o
+
+_encoding_lock = threading.Lock()
+logger = get_logger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Return the tiktoken encoding for model, or None if tiktoken can't be loaded."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        with _encoding_lock:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # The encoding files are downloaded on first use; fall back when offline
+        logger.warning("Could not load tokenizer for %s, estimating token counts: %s", model, e)
+        return None
+
+
+def count_tokens(text: str, model: str = 'gpt-4o') -> int:
+    """Count the tokens in text for model, estimating from its length without tiktoken."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))